@@ -1,8 +1,14 @@
 from __future__ import annotations
 
+import argparse
 import pathlib
 import subprocess
 
+from typing import Sequence
+
+from src.config import settings
+from src.db import loader
+
 
 def dump_sqlite() -> None:
     dump_root = pathlib.Path("data/migrate")
@@ -20,23 +26,67 @@ def dump_sqlite() -> None:
     return
 
 
-def read_sqlite(sql_root: str) -> None:
-    output_root = pathlib.Path("data/sqlite")
+def read_sqlite(
+    sql_root: str,
+    output_root: str = "data/sqlite",
+    workers: int = settings.LOADER_WORKERS,
+    force: bool = False
+) -> None:
+    output_root = pathlib.Path(output_root)
     output_root.mkdir(parents=True, exist_ok=True)
 
-    for fp in pathlib.Path(sql_root).glob("*.sql"):
-        print(fp.stem)
-        args = [
-            "sqlite3",
-            f"{output_root}/{fp.stem}",
-            f".read {fp.resolve()}"
-        ]
-        subprocess.run(args)
+    jobs = []
+    for fp in sorted(pathlib.Path(sql_root).glob("*.sql")):
+        db_path = output_root / fp.stem
+        if db_path.exists() and not force:
+            print(f"{db_path.name}: exists, skipped (use --force to reload)")
+            continue
+
+        jobs.append((fp, db_path))
+
+    for result in loader.load_dumps(jobs, workers=workers):
+        print(
+            f"{result.name}: {result.rows} row(s) in {result.seconds:.2f}s "
+            f"({result.rows_per_second:,.0f} rows/s)"
+        )
     return
 
 
-def main() -> int:
-    read_sqlite("data/sql")
+def main(argv: Sequence[str] | None = None) -> int:
+    aparser = argparse.ArgumentParser()
+    aparser.add_argument(
+        "--sql-root",
+        action="store",
+        default="data/sql",
+        help="directory of `.dump` files (<name>.db.sql)"
+    )
+    aparser.add_argument(
+        "--output-root",
+        action="store",
+        default="data/sqlite",
+        help="directory the databases are written to"
+    )
+    aparser.add_argument(
+        "--workers", "-j",
+        action="store",
+        type=int,
+        default=settings.LOADER_WORKERS,
+        help="stores loaded in parallel, 1 loads them in this process"
+    )
+    aparser.add_argument(
+        "--force",
+        action="store_true",
+        help="replace databases that already exist"
+    )
+
+    args = aparser.parse_args(argv)
+
+    read_sqlite(
+        args.sql_root,
+        output_root=args.output_root,
+        workers=args.workers,
+        force=args.force
+    )
     return 0
 
 
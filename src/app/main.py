@@ -11,6 +11,7 @@ import traceback
 
 
 from src import inventory
+from src import inventory_cache
 from src import tracker
 from src.config import settings
 from src.db import utils
@@ -299,7 +300,7 @@ def render_table(tracker_name: str):
             url=f"sqlite:///{settings.SQLITE_DB_ROOT}/{tracker_name}.db"
         )
 
-        df = inventory.compute_inventory(engine)
+        df = inventory_cache.get_inventory(engine)
     
         table_cols = [
                 "product_title",
@@ -309,7 +310,7 @@ def render_table(tracker_name: str):
                 "item_sold"
             ]
        
-        rowData = df[table_cols].to_dict(orient="records")
+        rowData = inventory.to_records(df[table_cols])
 
         first_updated = df["first_updated"].min()
         last_updated = df["last_updated"].max()
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import argparse
+import pathlib
+import time
+
+from typing import Sequence
+
+import pyarrow
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from sqlalchemy import Engine
+
+from src import inventory
+from src.config import settings
+from src.db import utils
+
+
+_ARCHIVE_INVENTORY_STMT = """
+SELECT
+    i.id,
+    i.variant_id,
+    i.updated_at,
+    i.inventory_quantity,
+    i.run_id,
+    substr(i.updated_at, 1, 7) AS month
+FROM inventory AS i
+WHERE i.id > ?
+ORDER BY i.id
+LIMIT ?
+"""
+
+_ARCHIVE_INVENTORY_SCHEMA = pyarrow.schema(
+    [
+        ("id", pyarrow.int64()),
+        ("variant_id", pyarrow.int64()),
+        ("updated_at", pyarrow.string()),
+        ("inventory_quantity", pyarrow.int64()),
+        ("run_id", pyarrow.int64()),
+        ("month", pyarrow.string()),
+    ]
+)
+
+
+def get_store_root(
+    root: pathlib.Path, dataset: str, store: str
+) -> pathlib.Path:
+    return root / dataset / f"store={store}"
+
+
+def get_watermark(root: pathlib.Path, store: str) -> int:
+    # last inventory.id already archived for `store`, files starting
+    # with "_" are skipped when the dataset is read
+    fp = get_store_root(root, "inventory", store) / "_watermark"
+    if not fp.exists():
+        return 0
+
+    return int(fp.read_text(encoding="utf-8").strip())
+
+
+def write_parquet(table: pyarrow.Table, fp: pathlib.Path) -> None:
+    # written under a hidden name first, readers never see half a file
+    fp.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp = fp.with_name("." + fp.name)
+    pq.write_table(table, tmp, compression="zstd")
+    tmp.replace(fp)
+
+
+def write_batch(
+    batch: pyarrow.Table, root: pathlib.Path, store: str
+) -> None:
+    store_root = get_store_root(root, "inventory", store)
+
+    for month in pc.unique(batch["month"]).to_pylist():
+        part = batch.filter(pc.equal(batch["month"], month))
+        first_id = pc.min(part["id"]).as_py()
+        last_id = pc.max(part["id"]).as_py()
+
+        # the file name only depends on the rows, re-running a batch
+        # after a crash overwrites what it had written
+        write_parquet(
+            part.drop_columns(["month"]),
+            store_root / f"month={month}" / f"part-{first_id}-{last_id}.parquet"
+        )
+
+
+def archive_store(
+    engine: Engine,
+    store: str,
+    root: pathlib.Path = settings.ARCHIVE_ROOT,
+    batch_size: int = settings.ARCHIVE_BATCH_SIZE
+) -> int:
+    # appends inventory rows newer than the watermark, then replaces the
+    # variant names snapshot
+    watermark = get_watermark(root, store)
+    archived = 0
+
+    while True:
+        batch = inventory.fetch_arrow_table(
+            engine,
+            _ARCHIVE_INVENTORY_STMT,
+            _ARCHIVE_INVENTORY_SCHEMA,
+            params=(watermark, batch_size)
+        )
+        if len(batch) == 0:
+            break
+
+        write_batch(batch, root=root, store=store)
+
+        watermark = pc.max(batch["id"]).as_py()
+        archived += len(batch)
+
+        fp = get_store_root(root, "inventory", store) / "_watermark"
+        fp.write_text(str(watermark), encoding="utf-8")
+
+    variants = inventory.fetch_arrow_table(
+        engine,
+        inventory._ARROW_VARIANTS_STMT,
+        inventory._ARROW_VARIANTS_SCHEMA
+    )
+    write_parquet(
+        variants,
+        get_store_root(root, "variants", store) / "variants.parquet"
+    )
+
+    return archived
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    aparser = argparse.ArgumentParser()
+    aparser.add_argument(
+        "--db",
+        action="append",
+        help="sqlite file to archive (repeatable), default: all files in "
+             "SQLITE_DB_ROOT"
+    )
+    aparser.add_argument(
+        "--root",
+        action="store",
+        type=pathlib.Path,
+        default=settings.ARCHIVE_ROOT,
+        help="archive directory, default: ARCHIVE_ROOT"
+    )
+    aparser.add_argument(
+        "--batch-size",
+        action="store",
+        type=int,
+        default=settings.ARCHIVE_BATCH_SIZE,
+        help="inventory rows read and written at a time"
+    )
+
+    args = aparser.parse_args(argv)
+
+    for db_path in utils.get_db_paths(args.db):
+        engine = utils.get_engine(url=f"sqlite:///{db_path}")
+
+        start = time.perf_counter()
+        archived = archive_store(
+            engine=engine,
+            store=db_path.stem,
+            root=args.root,
+            batch_size=args.batch_size
+        )
+        seconds = time.perf_counter() - start
+
+        print(
+            f"{db_path.stem}: {archived} row(s) archived up to id "
+            f"{get_watermark(args.root, db_path.stem)} in {seconds:.1f}s"
+        )
+
+        engine.dispose()
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
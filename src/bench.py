@@ -0,0 +1,493 @@
+from __future__ import annotations
+
+import argparse
+import datetime
+import gc
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+
+from typing import Any
+from typing import NamedTuple
+from typing import Sequence
+
+import pandas
+
+from sqlalchemy import Engine
+
+from src import inventory
+from src import parsers
+from src.config import settings
+from src.db import models
+from src.db import utils
+
+
+_FIXTURE_BASE_URL = "https://fixture.myshopify.com"
+
+
+class BenchResult(NamedTuple):
+    parser: str
+    pages: int
+    seconds: float
+    peak_kib: float
+    matches_golden: bool | None
+
+    @property
+    def ms_per_page(self) -> float:
+        return self.seconds / self.pages * 1000
+
+    @property
+    def pages_per_second(self) -> float:
+        return self.pages / self.seconds if self.seconds > 0 else 0.0
+
+
+def get_parser_names() -> list[str]:
+    return (
+        ["ShopifyProductsParser", "JSONParser"]
+        + [s.__name__ for s in parsers.HTMLParser.__subclasses__()]
+    )
+
+
+def load_fixture(parser_name: str) -> str:
+    for suffix in (".html", ".json"):
+        fp = settings.PARSER_FIXTURES_ROOT / f"{parser_name}{suffix}"
+        if fp.exists():
+            return fp.read_text(encoding="utf-8")
+
+    raise FileNotFoundError(
+        f"no fixture for {parser_name} in {settings.PARSER_FIXTURES_ROOT}"
+    )
+
+
+def load_golden() -> dict[str, Any]:
+    fp = settings.PARSER_FIXTURES_ROOT / "golden.json"
+    if not fp.exists():
+        return {}
+
+    with fp.open(mode="r", encoding="utf-8") as f:
+        return json.load(fp=f)
+
+
+def dump_golden(golden: dict[str, Any]) -> None:
+    fp = settings.PARSER_FIXTURES_ROOT / "golden.json"
+    with fp.open(mode="w", encoding="utf-8") as f:
+        json.dump(golden, fp=f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def run_parser(
+    parser_name: str, markup: str, fast: bool = True
+) -> Any:
+    if parser_name == "ShopifyProductsParser":
+        pparser = parsers.ShopifyProductsParser(response=json.loads(markup))
+        pparser.parse_products(base_url=_FIXTURE_BASE_URL)
+        return {
+            "products": pparser.products,
+            "variants": pparser.variants,
+        }
+
+    custom_parser = parsers.get_parser_class(parser_name)()
+    if not fast and getattr(custom_parser, "fast_extract", False):
+        custom_parser.fast_extract = False
+
+    return custom_parser.parse(markup=markup)
+
+
+def normalize(output: Any) -> Any:
+    return json.loads(json.dumps(output, default=str))
+
+
+def bench_parser(
+    parser_name: str,
+    markup: str,
+    repeat: int,
+    golden: dict[str, Any],
+    fast: bool = True
+) -> BenchResult:
+    output = normalize(run_parser(parser_name, markup, fast=fast))
+    expected = golden.get(parser_name)
+    matches = None if expected is None else output == expected
+
+    # allocations are measured on a separate pass, tracemalloc slows
+    # everything down and would skew the timings
+    gc.collect()
+    tracemalloc.start()
+    run_parser(parser_name, markup, fast=fast)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    gc.collect()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        run_parser(parser_name, markup, fast=fast)
+    seconds = time.perf_counter() - start
+
+    return BenchResult(
+        parser=parser_name,
+        pages=repeat,
+        seconds=seconds,
+        peak_kib=peak / 1024,
+        matches_golden=matches,
+    )
+
+
+def print_results(results: list[BenchResult]) -> None:
+    header = (
+        f"| {'parser':<24} | {'ms/page':>9} | {'pages/s':>9} "
+        f"| {'peak KiB':>9} | {'golden':>7} |"
+    )
+    print(header)
+    print("|" + "-" * (len(header) - 2) + "|")
+
+    for r in results:
+        golden = {True: "ok", False: "FAIL", None: "-"}[r.matches_golden]
+        print(
+            f"| {r.parser:<24} | {r.ms_per_page:>9.3f} "
+            f"| {r.pages_per_second:>9.1f} | {r.peak_kib:>9.1f} "
+            f"| {golden:>7} |"
+        )
+
+
+def calculate_item_sold_by_variants(
+    group: pandas.DataFrame
+) -> pandas.DataFrame:
+    item_sold = 0
+    values = group["inventory_quantity"].to_list()
+
+    for i, v in enumerate(values):
+        previous_v_id = 0 if i-1 <= 0 else i-1
+        changes = v - values[previous_v_id]
+
+        if changes < 0:
+            item_sold = item_sold - changes
+        else:
+            continue
+
+    last_updated = group["updated_at"].tail(1)
+    df = pandas.DataFrame(
+        data={
+            "last_updated": last_updated,
+            "item_sold": item_sold,
+        }
+    )
+
+    return df
+
+
+def load_inventory(
+    engine: Engine
+) -> pandas.DataFrame:
+    session = utils.get_sessionmaker(engine)
+
+    inventories = utils.execute_select_statement(
+        session=session(),
+        statement=inventory._COMBINED_INVENTORY_STMT
+    )
+
+    return pandas.DataFrame(data=inventories)
+
+
+def summarize_inventory_legacy(
+    inventory_data: pandas.DataFrame
+) -> pandas.DataFrame:
+    # one python loop and one small frame per variant, the original
+    # implementation every backend is benchmarked and checked against
+    def get_head(
+        group: pandas.DataFrame, n: int=1
+    ) -> pandas.DataFrame:
+        return group.head(n)
+
+    updated_inventory = (
+        inventory_data
+        .groupby("variant_id")[inventory_data.columns]
+        .apply(calculate_item_sold_by_variants, include_groups=False)
+        .reset_index(level=0, drop=False)
+        .fillna(0)
+    )
+
+    initial_inventory = (
+        inventory_data
+        .groupby("variant_id", as_index=False)[inventory_data.columns]
+        .apply(get_head)
+        .drop(axis=1, labels=["id"])
+        .reset_index(drop=True)
+        .rename(
+            axis=1,
+            mapper={
+                "updated_at": "first_updated",
+                "inventory_quantity": "initial_amount"
+            }
+        )
+    )
+
+    df = (
+        pandas.merge(
+            left=initial_inventory,
+            right=updated_inventory,
+            how="left",
+            on="variant_id",
+        )
+        .sort_values(
+            by=["item_sold", "initial_amount"],
+            ascending=False
+        )
+    )
+
+    return df.loc[:, inventory._INVENTORY_COLUMNS]
+
+
+def make_inventory_data(
+    variants: int, runs: int, seed: int = 0
+) -> pandas.DataFrame:
+    # synthetic `_COMBINED_INVENTORY_STMT` rows: every run records each
+    # variant once, quantities mostly sell down with the odd restock
+    rng = random.Random(seed)
+    quantities = [rng.randint(1, 50) for _ in range(variants)]
+    rows = []
+
+    for run in range(runs):
+        updated_at = (
+            datetime.datetime(2024, 1, 1) + datetime.timedelta(hours=run)
+        ).strftime("%Y-%m-%d %H:%M:%S")
+        for v in range(variants):
+            if rng.random() < 0.05:
+                quantities[v] += rng.randint(5, 30)
+            elif rng.random() < 0.3:
+                quantities[v] = max(quantities[v] - rng.randint(1, 3), 0)
+
+            # the query only returns rows with stock
+            if quantities[v] <= 0:
+                continue
+
+            rows.append(
+                {
+                    "id": len(rows) + 1,
+                    "product_id": v // 4,
+                    "updated_at": updated_at,
+                    "product_title": f"product {v // 4}",
+                    "product_url": f"{_FIXTURE_BASE_URL}/products/{v // 4}",
+                    "product_type": "fixture",
+                    "variant_id": v,
+                    "variant_title": f"variant {v}",
+                    "inventory_quantity": quantities[v],
+                }
+            )
+
+    return pandas.DataFrame(data=rows)
+
+
+def _same_summary(
+    left: pandas.DataFrame, right: pandas.DataFrame
+) -> bool:
+    # compares values the way the consumers see them, the legacy frame
+    # may carry item_sold as float after `fillna` and the arrow backend
+    # has arrow dtypes
+    def prepare(df: pandas.DataFrame) -> list[list]:
+        return [df.columns.tolist()] + inventory.to_rows(
+            df.astype({"item_sold": "int64"})
+        )
+
+    return prepare(left) == prepare(right)
+
+
+def make_inventory_db(
+    engine: Engine, data: pandas.DataFrame
+) -> None:
+    utils.init_database(engine=engine, metadata=models.ShopifyBase.metadata)
+
+    products = (
+        data.drop_duplicates(subset="product_id")
+        .loc[:, ["product_id", "product_title", "product_url", "product_type"]]
+        .rename(
+            axis=1,
+            mapper={
+                "product_id": "id",
+                "product_title": "title",
+                "product_url": "url",
+            }
+        )
+        .assign(
+            vendor="fixture",
+            handle=lambda df: df["id"].astype(str),
+            status_code=200
+        )
+    )
+    variants = (
+        data.drop_duplicates(subset="variant_id")
+        .loc[:, ["variant_id", "variant_title", "product_id"]]
+        .rename(axis=1, mapper={"variant_id": "id", "variant_title": "title"})
+    )
+    inventories = data.loc[
+        :, ["id", "updated_at", "variant_id", "inventory_quantity"]
+    ]
+
+    for name, df in [
+        ("product", products),
+        ("variant", variants),
+        ("inventory", inventories),
+    ]:
+        df.to_sql(name=name, con=engine, if_exists="append", index=False)
+
+
+def bench_inventory(
+    variants: int, runs: int, repeat: int
+) -> int:
+    data = make_inventory_data(variants=variants, runs=runs)
+    print(
+        f"{len(data)} inventory row(s), {variants} variant(s), "
+        f"{runs} run(s)"
+    )
+
+    header = (
+        f"| {'method':<24} | {'seconds':>9} "
+        f"| {'speedup':>9} | {'peak MiB':>9} | {'same':>7} |"
+    )
+    print(header)
+    print("|" + "-" * (len(header) - 2) + "|")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = utils.get_engine(url=f"sqlite:///{tmp}/bench.db")
+        make_inventory_db(engine=engine, data=data)
+
+        # every method reads the same database end to end
+        methods = {
+            "legacy": lambda: summarize_inventory_legacy(
+                load_inventory(engine)
+            ),
+            # streams the history in INVENTORY_CHUNK_SIZE row chunks
+            "pandas": lambda: inventory.compute_inventory(
+                engine, backend="pandas"
+            ),
+            "sql": lambda: inventory.compute_inventory(
+                engine, backend="sql"
+            ),
+            "arrow": lambda: inventory.compute_inventory(
+                engine, backend="arrow"
+            ),
+            # the first call folds the whole history, then it only reads
+            "summary": lambda: inventory.compute_inventory(
+                engine, backend="summary"
+            ),
+        }
+        expected = methods["legacy"]()
+
+        baseline = None
+        failed = False
+        for name, summarize in methods.items():
+            same = _same_summary(summarize(), expected)
+            failed = failed or not same
+
+            gc.collect()
+            tracemalloc.start()
+            summarize()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            gc.collect()
+            start = time.perf_counter()
+            for _ in range(repeat):
+                summarize()
+            seconds = (time.perf_counter() - start) / repeat
+
+            if baseline is None:
+                baseline = seconds
+            print(
+                f"| {name:<24} | {seconds:>9.4f} "
+                f"| {baseline / seconds:>8.1f}x "
+                f"| {peak / 1024 / 1024:>9.1f} "
+                f"| {'ok' if same else 'FAIL':>7} |"
+            )
+
+        engine.dispose()
+
+    return 1 if failed else 0
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    aparser = argparse.ArgumentParser()
+    aparser.add_argument(
+        "--parser", "-p",
+        action="append",
+        help="only benchmark this parser (repeatable), default: all"
+    )
+    aparser.add_argument(
+        "--repeat", "-n",
+        action="store",
+        type=int,
+        default=50,
+        help="number of times each fixture page is parsed"
+    )
+    aparser.add_argument(
+        "--no-fast",
+        action="store_true",
+        help="disable the <script> extraction fast path (full bs4 parse)"
+    )
+    aparser.add_argument(
+        "--update-golden",
+        action="store_true",
+        help="rewrite golden.json from the current parser outputs"
+    )
+
+    aparser.add_argument(
+        "--inventory",
+        action="store_true",
+        help="benchmark the inventory summary on synthetic rows instead"
+    )
+    aparser.add_argument(
+        "--variants",
+        action="store",
+        type=int,
+        default=2000,
+        help="with --inventory, number of synthetic variants"
+    )
+    aparser.add_argument(
+        "--runs",
+        action="store",
+        type=int,
+        default=30,
+        help="with --inventory, number of synthetic tracker runs"
+    )
+
+    args = aparser.parse_args(argv)
+
+    if args.inventory:
+        return bench_inventory(
+            variants=args.variants,
+            runs=args.runs,
+            repeat=max(args.repeat // 10, 1)
+        )
+
+    names = args.parser or get_parser_names()
+
+    if args.update_golden:
+        golden = load_golden()
+        for name in names:
+            golden[name] = normalize(
+                run_parser(name, load_fixture(name), fast=not args.no_fast)
+            )
+        dump_golden(golden)
+        print(f"updated golden outputs for {len(names)} parser(s)")
+        return 0
+
+    golden = load_golden()
+    results = [
+        bench_parser(
+            parser_name=name,
+            markup=load_fixture(name),
+            repeat=args.repeat,
+            golden=golden,
+            fast=not args.no_fast
+        )
+        for name in names
+    ]
+    print_results(results)
+
+    if any(r.matches_golden is False for r in results):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
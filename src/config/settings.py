@@ -17,14 +17,90 @@ SQLITE_DB_ROOT = _mkdir("data/sqlite")
 TRACKERS_CONFIG_FILEPATH = CONFIG_ROOT / "trackers.json"
 SHEETS_CONFIG_FILEPATH = CONFIG_ROOT / "sheets.json"
 LOGGER_FILEPATH = LOG_ROOT / "tracker.log.jsonl"
+PARSER_FIXTURES_ROOT = pathlib.Path("data/fixtures/parsers")
+INVENTORY_CACHE_ROOT = pathlib.Path("data/cache/inventory")
+ARCHIVE_ROOT = pathlib.Path("data/archive")
 
 
 # async/sleep config
 MAX_ASYNC_WORKER = 45
-ASYNC_SLEEP_DELAY = 4
+
+CATALOG_PAGE_SIZE = 250
+MAX_CONCURRENT_CATALOG_PAGES = 8
+STREAM_CATALOG_PAGES = True
+
+TODO_CHUNK_SIZE = 500
+TODO_QUEUE_SIZE = 2 * MAX_ASYNC_WORKER
+
+# products whose variants /products.json reports as all unavailable:
+# "skip" fetching them (their variants are stored as 0 from the catalog),
+# fetch them "last", or "fetch" them like any other product
+SOLD_OUT_POLICY = "skip"
+
+# send If-None-Match/If-Modified-Since for product fetches and skip
+# responses whose body hash did not change since the last run
+CONDITIONAL_REQUESTS = True
 
 MAX_RETRIES = 10
 RETRY_SLEEP_DELAY = 4
+MAX_RETRY_DELAY = 120
+RETRY_BUDGET = 1000
+
+
+# inventory summary backend (see src/inventory.py): "summary", "sql",
+# "arrow", "pandas" or "archive"
+INVENTORY_BACKEND = "summary"
+# rows per chunk when the "pandas"/"arrow" backends stream the history
+INVENTORY_CHUNK_SIZE = 50_000
+
+# results kept in memory per process, and optionally as parquet files
+# so a restarted dashboard/sheet export starts warm
+INVENTORY_CACHE_SIZE = 16
+INVENTORY_CACHE_DISK = False
+
+# inventory rows per `st-archive` batch (see src/archive.py)
+ARCHIVE_BATCH_SIZE = 500_000
+
+# `st-db --retention` (see src/db/retention.py): inventory rows older than
+# RETENTION_RAW_DAYS are thinned to hourly change points, older than
+# RETENTION_HOURLY_DAYS to daily ones. trackers.json "retention" overrides
+# this per tracker
+RETENTION_RAW_DAYS = 30
+RETENTION_HOURLY_DAYS = 180
+
+# db writer config (see src/db/writer.py)
+WRITER_BATCH_SIZE = 2000
+WRITER_FLUSH_INTERVAL = 5
+WRITER_QUEUE_SIZE = 1000
+
+
+# bulk loader config (see src/db/loader.py, migrate.py): stores loaded in
+# parallel and dump statements per transaction
+LOADER_WORKERS = 4
+LOADER_TRANSACTION_SIZE = 50_000
+
+
+# parser process pool config (see src/parse_pool.py), 0 parses in-loop
+PARSER_WORKERS = 2
+PARSER_MAX_TASKS_PER_CHILD = 500
+
+
+# http client config
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 50
+MAX_CONNECTIONS_PER_HOST = 20
+KEEPALIVE_EXPIRY = 30
+# connect/read/write timeout, waits for a pooled connection are unbounded
+REQUEST_TIMEOUT = 5
+HTTP2_ENABLED = False
+
+
+# per-host adaptive concurrency (see src/throttle.py)
+AIMD_INITIAL_LIMIT = 4
+AIMD_MIN_LIMIT = 1
+AIMD_DECREASE_FACTOR = 0.5
+THROTTLE_COOLDOWN = 15
+MAX_THROTTLE_COOLDOWN = 120
 
 
 # headers config
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import argparse
+import pathlib
+import re
+
+from typing import Any
+from typing import NamedTuple
+from typing import Sequence
+
+from sqlalchemy import Engine
+from sqlalchemy import text
+
+from src import inventory
+from src import runner
+from src import tracker
+from src.config import settings
+from src.db import models
+from src.db import retention
+from src.db import summary
+from src.db import utils
+
+
+class HotQuery(NamedTuple):
+    name: str
+    statement: str
+    params: dict[str, Any] = {}
+
+
+HOT_QUERIES = [
+    HotQuery(
+        name="runner: todos",
+        statement=runner._TODOS_STMT,
+        params={
+            "after_id": 0,
+            "limit": settings.TODO_CHUNK_SIZE,
+            "in_stock": 1,
+        }
+    ),
+    HotQuery(
+        name="runner: last quantities",
+        statement=runner._LAST_QUANTITIES_STMT
+    ),
+    HotQuery(
+        name="summary: fold",
+        statement=summary._FOLD_SALES_SUMMARY_STMT
+    ),
+    HotQuery(
+        name="summary: stale check",
+        statement=summary._IS_STALE_STMT
+    ),
+    HotQuery(
+        name="inventory: combined history (pandas)",
+        statement=inventory._COMBINED_INVENTORY_STMT
+    ),
+    HotQuery(
+        name="inventory: window summary (sql)",
+        statement=inventory._INVENTORY_SUMMARY_STMT
+    ),
+    HotQuery(
+        name="inventory: sales summary (summary)",
+        statement=inventory._SALES_SUMMARY_STMT
+    ),
+    HotQuery(
+        name="inventory: quantity as of run",
+        statement=inventory._QUANTITY_AS_OF_STMT,
+        params={"run_id": 0}
+    ),
+]
+
+
+def explain(
+    engine: Engine, statement: str, params: dict[str, Any]
+) -> list[str]:
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("EXPLAIN QUERY PLAN " + statement), params
+        ).fetchall()
+
+    # rows are (id, parent, notused, detail), indent children under parents
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+
+    return lines
+
+
+def get_table_aliases(statement: str) -> dict[str, str]:
+    aliases = {
+        name: name for name in models.ShopifyBase.metadata.tables
+    }
+    for name, alias in re.findall(
+        r"(?:FROM|JOIN)\s+(\w+)\s+AS\s+(\w+)", statement, flags=re.I
+    ):
+        if name in models.ShopifyBase.metadata.tables:
+            aliases[alias] = name
+
+    return aliases
+
+
+def is_full_scan(line: str, aliases: dict[str, str]) -> bool:
+    # scans of materialized ctes/subqueries are expected. a table SCAN is
+    # unconstrained even when it goes through an index ("USING [COVERING]
+    # INDEX" only sets the order), constrained reads show up as SEARCH
+    m = re.match(r"\s*SCAN (\w+)", line)
+    if m is None:
+        return False
+
+    return m.group(1) in aliases
+
+
+def print_query_plans(engine: Engine) -> None:
+    for query in HOT_QUERIES:
+        print(f"-- {query.name}")
+
+        aliases = get_table_aliases(query.statement)
+        for line in explain(engine, query.statement, query.params):
+            marker = "!" if is_full_scan(line, aliases) else " "
+            print(f"{marker} {line}")
+
+        print()
+
+
+def compact(engine: Engine) -> None:
+    # VACUUM cannot run inside a transaction
+    with engine.connect().execution_options(
+        isolation_level="AUTOCOMMIT"
+    ) as conn:
+        conn.execute(text("VACUUM"))
+
+
+def get_tracker_config(
+    trackers: list[tracker.TrackerConfig], db_path: pathlib.Path
+) -> tracker.TrackerConfig | None:
+    # the runner writes to `db_path` (named after `db_name`), migrate.py,
+    # st-sheet and the dashboard use <SQLITE_DB_ROOT>/<name>.db
+    db_path = db_path.resolve()
+    for t in trackers:
+        if db_path in (
+            t.db_path.resolve(),
+            (pathlib.Path(t.sqlite_root) / f"{t.name}.db").resolve(),
+        ):
+            return t
+
+    return None
+
+
+def apply_retention(
+    engine: Engine, config: tracker.TrackerConfig | None
+) -> None:
+    # deleted rows cannot come back, files no tracker claims are left
+    # alone rather than thinned with the defaults
+    if config is None:
+        print("retention: no tracker in trackers.json uses this file")
+        return
+
+    try:
+        policy = retention.get_policy(config.retention)
+    except ValueError as e:
+        # a bad entry only skips its own database
+        print(f"retention: invalid config for {config.name}: {e}")
+        return
+
+    if policy is None:
+        print("retention: disabled in trackers.json")
+        return
+
+    session = utils.get_sessionmaker(engine)
+    deleted = retention.apply_retention(session=session(), policy=policy)
+    print(
+        f"retention: {deleted} inventory row(s) removed (raw "
+        f"{policy.raw_days} days, hourly {policy.hourly_days} days)"
+    )
+
+    compact(engine)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    aparser = argparse.ArgumentParser()
+    aparser.add_argument(
+        "--db",
+        action="append",
+        help="sqlite file to work on (repeatable), default: all files in "
+             "SQLITE_DB_ROOT"
+    )
+    aparser.add_argument(
+        "--ensure-indexes",
+        action="store_true",
+        help="create missing tables, columns and indexes"
+    )
+    aparser.add_argument(
+        "--analyze",
+        action="store_true",
+        help="refresh the query planner statistics (ANALYZE)"
+    )
+    aparser.add_argument(
+        "--retention",
+        action="store_true",
+        help="thin old inventory rows to hourly/daily change points (per "
+             "tracker \"retention\" in trackers.json), then VACUUM and "
+             "ANALYZE"
+    )
+    aparser.add_argument(
+        "--explain",
+        action="store_true",
+        help="print EXPLAIN QUERY PLAN for every hot query, `!` marks full "
+             "table scans"
+    )
+
+    args = aparser.parse_args(argv)
+
+    trackers = tracker.load_tracker_configs() if args.retention else []
+
+    for db_path in utils.get_db_paths(args.db):
+        print(f"== {db_path}")
+        engine = utils.get_engine(url=f"sqlite:///{db_path}")
+
+        if args.ensure_indexes:
+            utils.init_database(
+                engine=engine, metadata=models.ShopifyBase.metadata
+            )
+
+        if args.retention:
+            apply_retention(
+                engine=engine,
+                config=get_tracker_config(trackers, db_path)
+            )
+
+        if args.analyze or args.retention:
+            with engine.begin() as conn:
+                conn.execute(text("ANALYZE"))
+
+        if args.explain:
+            print_query_plans(engine)
+
+        engine.dispose()
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
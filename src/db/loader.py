@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import concurrent.futures
+import multiprocessing
+import os
+import pathlib
+import re
+import sqlite3
+import time
+
+from typing import Iterator
+from typing import NamedTuple
+
+from src.config import settings
+from src.db import models
+from src.db import summary
+from src.db import utils
+
+
+# nothing to recover from while the file is still being built, it is
+# only moved into place once complete
+_BULK_PRAGMAS = [
+    "PRAGMA journal_mode=OFF",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA locking_mode=EXCLUSIVE",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+]
+
+_CREATE_INDEX_RE = re.compile(r"\s*CREATE\s+(UNIQUE\s+)?INDEX\b", flags=re.I)
+_TRANSACTION_RE = re.compile(r"\s*(BEGIN|COMMIT|END)\b", flags=re.I)
+
+
+class LoadResult(NamedTuple):
+    name: str
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+def iter_statements(fp: pathlib.Path) -> Iterator[str]:
+    # streams a `.dump` file one complete statement at a time, string
+    # literals may span lines and contain ";"
+    buffer = []
+    with fp.open(mode="r", encoding="utf-8") as f:
+        for line in f:
+            buffer.append(line)
+            if not line.rstrip().endswith(";"):
+                continue
+
+            statement = "".join(buffer)
+            if sqlite3.complete_statement(statement):
+                yield statement
+                buffer = []
+
+    if "".join(buffer).strip():
+        yield "".join(buffer)
+
+
+def load_dump(
+    sql_path: pathlib.Path,
+    db_path: pathlib.Path,
+    transaction_size: int = settings.LOADER_TRANSACTION_SIZE
+) -> LoadResult:
+    start = time.perf_counter()
+
+    tmp_path = db_path.with_name(f".{db_path.name}.loading")
+    tmp_path.unlink(missing_ok=True)
+
+    conn = sqlite3.connect(tmp_path, isolation_level=None)
+    for pragma in _BULK_PRAGMAS:
+        conn.execute(pragma)
+
+    rows = 0
+    batch = []
+    deferred = []
+
+    def flush() -> None:
+        if batch:
+            conn.executescript("BEGIN;\n" + "".join(batch) + "\nCOMMIT;")
+            batch.clear()
+
+    try:
+        for statement in iter_statements(sql_path):
+            if statement.lstrip()[:6].upper() == "INSERT":
+                batch.append(statement)
+                rows += 1
+                if len(batch) >= transaction_size:
+                    flush()
+            elif _TRANSACTION_RE.match(statement):
+                # the dump's own single transaction, batches replace it
+                continue
+            elif _CREATE_INDEX_RE.match(statement):
+                # indexes are built once, after all rows are in
+                deferred.append(statement)
+            else:
+                flush()
+                conn.executescript(statement)
+
+        flush()
+        for statement in deferred:
+            conn.executescript(statement)
+    finally:
+        conn.close()
+
+    # bring older dumps up to the current models (columns, tables,
+    # indexes) and build the sales summary from the loaded history
+    engine = utils.get_engine(url=f"sqlite:///{tmp_path}")
+    utils.init_database(engine=engine, metadata=models.ShopifyBase.metadata)
+
+    session = utils.get_sessionmaker(engine)
+    summary.rebuild_sales_summary(session=session())
+    engine.dispose()
+
+    # a wal/shm pair left by the replaced database would be replayed onto
+    # the new file the next time it is opened
+    for suffix in ("-wal", "-shm"):
+        db_path.with_name(db_path.name + suffix).unlink(missing_ok=True)
+
+    tmp_path.replace(db_path)
+
+    return LoadResult(
+        name=db_path.name,
+        rows=rows,
+        seconds=time.perf_counter() - start,
+    )
+
+
+def load_dumps(
+    jobs: list[tuple[pathlib.Path, pathlib.Path]],
+    workers: int = settings.LOADER_WORKERS
+) -> Iterator[LoadResult]:
+    # (sql_path, db_path) pairs, one store per process
+    workers = min(workers, len(jobs), os.cpu_count() or 1)
+    if workers <= 1:
+        for sql_path, db_path in jobs:
+            yield load_dump(sql_path, db_path)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        futures = [
+            executor.submit(load_dump, sql_path, db_path)
+            for sql_path, db_path in jobs
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
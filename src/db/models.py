@@ -5,7 +5,9 @@ from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import relationship
 from sqlalchemy import Integer, BigInteger
 from sqlalchemy import String
+from sqlalchemy import Boolean
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import DateTime
 from sqlalchemy.sql import func
 
@@ -33,17 +35,48 @@ class ShopifyProduct(ShopifyBase):
 
 class ShopifyVariant(ShopifyBase):
     __tablename__ = "variant"
+    __table_args__ = (
+        Index("ix_variant_product_id", "product_id"),
+    )
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     title: Mapped[str] = mapped_column(String, nullable=False)
 
     product_id: Mapped[int] = mapped_column(
         BigInteger, ForeignKey(ShopifyProduct.id), nullable=False
     )
+    # as reported by /products.json, NULL when never seen
+    available: Mapped[bool] = mapped_column(Boolean, nullable=True)
+
     product = relationship(ShopifyProduct, foreign_keys=[product_id])
 
 
+class ShopifyRun(ShopifyBase):
+    # one row per tracker run, inventory rows point back at the run that
+    # recorded them
+    __tablename__ = "run"
+    id: Mapped[int] = mapped_column(
+        Integer, autoincrement=True, primary_key=True
+    )
+    started_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
+    finished_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    storage: Mapped[str] = mapped_column(String(10), nullable=True)
+
+
 class ShopifyInventory(ShopifyBase):
     __tablename__ = "inventory"
+    # full-history queries walk each variant's rows in id (= recording)
+    # order and only need the quantity, so this index covers them. the
+    # summary fold must not use it, see src/db/summary.py
+    __table_args__ = (
+        Index(
+            "ix_inventory_variant_id_id_quantity",
+            "variant_id", "id", "inventory_quantity"
+        ),
+    )
     id: Mapped[int] = mapped_column(
         Integer, autoincrement=True, primary_key=True
     )
@@ -59,6 +92,31 @@ class ShopifyInventory(ShopifyBase):
         Integer, nullable=True, default=0
     )
 
+    # NULL for rows recorded before runs were tracked
+    run_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey(ShopifyRun.id), nullable=True
+    )
+
+
+class ShopifyVariantSales(ShopifyBase):
+    # running per-variant totals over the inventory rows with stock, kept
+    # up to date by `summary.fold_sales_summary` as rows are written
+    __tablename__ = "variant_sales_summary"
+    variant_id: Mapped[int] = mapped_column(
+        BigInteger, ForeignKey(ShopifyVariant.id), primary_key=True
+    )
+    initial_amount: Mapped[int] = mapped_column(Integer, nullable=False)
+    last_amount: Mapped[int] = mapped_column(Integer, nullable=False)
+    item_sold: Mapped[int] = mapped_column(Integer, nullable=False)
+    first_updated: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    last_updated: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    # highest inventory.id folded into this row
+    last_inventory_id: Mapped[int] = mapped_column(Integer, nullable=False)
+
 
 class ShopifyMeta(ShopifyBase):
     __tablename__ = "meta"
@@ -77,3 +135,13 @@ class ShopifyCounter(ShopifyBase):
         server_default=func.now(),
         primary_key=True
     )
+
+
+class ShopifyHttpCache(ShopifyBase):
+    # validators and body hash of the last product response per url,
+    # unchanged responses are neither parsed nor stored again
+    __tablename__ = "http_cache"
+    url: Mapped[str] = mapped_column(String, primary_key=True)
+    etag: Mapped[str] = mapped_column(String, nullable=True)
+    last_modified: Mapped[str] = mapped_column(String, nullable=True)
+    content_hash: Mapped[str] = mapped_column(String(32), nullable=True)
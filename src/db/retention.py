@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import datetime
+
+from typing import NamedTuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from src.config import settings
+from src.db import summary
+
+
+# thins inventory rows recorded before :hourly_before. a row that only
+# repeats the quantity recorded before it goes, then per variant and
+# bucket (hour, or day before :daily_before) the first and last rows
+# stay, in between only rows that change the sold-unit math do:
+# - a stocked row (quantity > 0) goes when it repeats the previous
+#   stocked quantity or sits strictly inside a rising/falling stretch,
+#   the decrease across a monotone stretch is the same without it
+# - a sold-out row goes when the row before it was sold out too
+# the first and last stocked row of every variant are never removed, so
+# item_sold, initial_amount and first/last_updated are unchanged
+_APPLY_RETENTION_STMT = """
+WITH old AS (
+    SELECT
+        i.id,
+        i.variant_id,
+        i.inventory_quantity AS quantity,
+        CASE
+            WHEN i.updated_at < :daily_before
+                THEN substr(i.updated_at, 1, 10)
+            ELSE substr(i.updated_at, 1, 13)
+        END AS bucket
+    FROM inventory AS i
+    WHERE i.updated_at < :hourly_before
+),
+edges AS (
+    SELECT MIN(id) AS id
+    FROM old
+    GROUP BY variant_id, bucket
+    UNION
+    SELECT MAX(id) AS id
+    FROM old
+    GROUP BY variant_id, bucket
+),
+history AS (
+    SELECT
+        i.id,
+        LAG(i.inventory_quantity) OVER (
+            PARTITION BY i.variant_id ORDER BY i.id
+        ) AS previous_quantity
+    FROM inventory AS i
+),
+stocked AS (
+    SELECT
+        i.id,
+        LAG(i.inventory_quantity) OVER (
+            PARTITION BY i.variant_id ORDER BY i.id
+        ) AS previous_quantity,
+        LEAD(i.inventory_quantity) OVER (
+            PARTITION BY i.variant_id ORDER BY i.id
+        ) AS next_quantity
+    FROM inventory AS i
+    WHERE i.inventory_quantity > 0
+)
+DELETE FROM inventory
+WHERE id IN (
+    SELECT o.id
+    FROM old AS o
+    LEFT JOIN stocked AS s
+        ON s.id = o.id
+    LEFT JOIN history AS h
+        ON h.id = o.id
+    WHERE (
+        h.previous_quantity = o.quantity
+        AND (o.quantity <= 0 OR s.next_quantity IS NOT NULL)
+    )
+    OR (
+        o.id NOT IN (SELECT id FROM edges)
+        AND (
+            (
+                o.quantity > 0
+                AND s.previous_quantity IS NOT NULL
+                AND s.next_quantity IS NOT NULL
+                AND (
+                    s.previous_quantity = o.quantity
+                    OR (
+                        s.previous_quantity < o.quantity
+                        AND o.quantity < s.next_quantity
+                    )
+                    OR (
+                        s.previous_quantity > o.quantity
+                        AND o.quantity > s.next_quantity
+                    )
+                )
+            )
+            OR (
+                COALESCE(o.quantity, 0) <= 0
+                AND COALESCE(h.previous_quantity, 1) <= 0
+            )
+        )
+    )
+)
+"""
+
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class RetentionPolicy(NamedTuple):
+    # rows younger than `raw_days` are kept as recorded, older ones are
+    # thinned per hour, and per day past `hourly_days`
+    raw_days: int = settings.RETENTION_RAW_DAYS
+    hourly_days: int = settings.RETENTION_HOURLY_DAYS
+
+    def get_cutoffs(self, now: datetime.datetime) -> dict[str, str]:
+        return {
+            "hourly_before": (
+                now - datetime.timedelta(days=self.raw_days)
+            ).strftime(_TIMESTAMP_FORMAT),
+            "daily_before": (
+                now - datetime.timedelta(days=self.hourly_days)
+            ).strftime(_TIMESTAMP_FORMAT),
+        }
+
+
+def get_policy(retention: dict | bool | None) -> RetentionPolicy | None:
+    # trackers.json "retention": missing uses the settings defaults,
+    # false turns it off, an object overrides raw_days/hourly_days
+    if retention is False:
+        return None
+
+    if retention is None or retention is True:
+        return RetentionPolicy()
+
+    if not isinstance(retention, dict):
+        raise ValueError(
+            f"`retention` must be true, false or an object, got {retention!r}"
+        )
+
+    unknown = set(retention) - set(RetentionPolicy._fields)
+    if unknown:
+        raise ValueError(
+            f"unknown `retention` key(s) {sorted(unknown)}, expected "
+            f"{list(RetentionPolicy._fields)}"
+        )
+
+    for key, value in retention.items():
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            raise ValueError(
+                f"`retention.{key}` must be a whole number of days, got "
+                f"{value!r}"
+            )
+
+    return RetentionPolicy(**retention)
+
+
+def apply_retention(
+    session: Session,
+    policy: RetentionPolicy,
+    now: datetime.datetime | None = None
+) -> int:
+    # inventory timestamps are stored in utc (sqlite CURRENT_TIMESTAMP)
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+    with session:
+        session.execute(text(_APPLY_RETENTION_STMT), policy.get_cutoffs(now))
+        # the driver reports no rowcount for statements starting with WITH
+        deleted = session.execute(text("SELECT changes()")).scalar()
+
+        # totals do not change, but the summary points at row ids
+        session.execute(text("DELETE FROM variant_sales_summary"))
+        summary.fold_sales_summary(session)
+        session.commit()
+
+    return deleted
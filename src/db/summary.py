@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+# folds every inventory row past the watermark into
+# `variant_sales_summary`: sales inside the new rows come from LAG(), the
+# step from a variant's stored last_amount to its first new row is added
+# on conflict. the new rows are read by rowid range first: left to the
+# window, sqlite prefers walking the whole (variant_id, id) index in
+# partition order and filtering every row against the watermark
+# (MATERIALIZED needs sqlite >= 3.35)
+_FOLD_SALES_SUMMARY_STMT = """
+WITH watermark AS (
+    SELECT COALESCE(MAX(last_inventory_id), 0) AS id
+    FROM variant_sales_summary
+),
+new_rows AS MATERIALIZED (
+    SELECT
+        i.id,
+        i.variant_id,
+        i.inventory_quantity
+    FROM inventory AS i
+    WHERE i.id > (SELECT id FROM watermark)
+        AND i.inventory_quantity > 0
+),
+history AS (
+    SELECT
+        n.id,
+        n.variant_id,
+        n.inventory_quantity,
+        LAG(n.inventory_quantity) OVER (
+            PARTITION BY n.variant_id ORDER BY n.id
+        ) AS previous_quantity
+    FROM new_rows AS n
+),
+changes AS (
+    SELECT
+        variant_id,
+        COALESCE(
+            SUM(MAX(previous_quantity - inventory_quantity, 0)), 0
+        ) AS item_sold,
+        MIN(id) AS first_id,
+        MAX(id) AS last_id
+    FROM history
+    GROUP BY variant_id
+)
+INSERT INTO variant_sales_summary (
+    variant_id,
+    initial_amount,
+    last_amount,
+    item_sold,
+    first_updated,
+    last_updated,
+    last_inventory_id
+)
+SELECT
+    c.variant_id,
+    f.inventory_quantity,
+    l.inventory_quantity,
+    c.item_sold,
+    f.updated_at,
+    l.updated_at,
+    c.last_id
+FROM changes AS c
+JOIN inventory AS f
+    ON f.id = c.first_id
+JOIN inventory AS l
+    ON l.id = c.last_id
+WHERE true
+ON CONFLICT (variant_id) DO UPDATE SET
+    item_sold = item_sold + excluded.item_sold
+        + MAX(last_amount - excluded.initial_amount, 0),
+    last_amount = excluded.last_amount,
+    last_updated = excluded.last_updated,
+    last_inventory_id = excluded.last_inventory_id
+"""
+
+_IS_STALE_STMT = """
+SELECT EXISTS (
+    SELECT 1
+    FROM inventory
+    WHERE id > (
+        SELECT COALESCE(MAX(last_inventory_id), 0)
+        FROM variant_sales_summary
+    )
+        AND inventory_quantity > 0
+)
+"""
+
+
+def fold_sales_summary(session: Session) -> None:
+    # runs inside the caller's transaction, so the summary commits (or
+    # rolls back) together with the inventory rows it describes
+    session.execute(text(_FOLD_SALES_SUMMARY_STMT))
+
+
+def is_stale(session: Session) -> bool:
+    return bool(session.execute(text(_IS_STALE_STMT)).scalar())
+
+
+def refresh_sales_summary(session: Session) -> None:
+    # catches up on rows written without the fold (older runs, restored
+    # dumps), a no-op once the summary is current
+    with session:
+        if is_stale(session):
+            fold_sales_summary(session)
+            session.commit()
+
+
+def rebuild_sales_summary(session: Session) -> None:
+    # for when history rows are rewritten or deleted under the summary
+    with session:
+        session.execute(text("DELETE FROM variant_sales_summary"))
+        fold_sales_summary(session)
+        session.commit()
@@ -6,6 +6,8 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy import MetaData
 from sqlalchemy import Label
 from sqlalchemy import Engine, create_engine
+from sqlalchemy import event
+from sqlalchemy import inspect
 from sqlalchemy import select, table, column
 from sqlalchemy import text
 from sqlalchemy import update
@@ -14,6 +16,8 @@ from sqlalchemy.dialects.sqlite import insert as sqlite_upsert
 
 import pathlib
 
+from src.config import settings
+
 
 LocalSession = sessionmaker()
 
@@ -22,6 +26,55 @@ def init_database(
     engine: Engine, metadata: MetaData
 ) -> None:
     metadata.create_all(engine)
+    add_missing_columns(engine, metadata)
+    ensure_indexes(engine, metadata)
+
+
+def ensure_indexes(
+    engine: Engine, metadata: MetaData
+) -> None:
+    # like columns, indexes declared later are missing from older
+    # databases, `checkfirst` makes this a no-op once they exist
+    for tbl in metadata.sorted_tables:
+        for index in tbl.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def add_missing_columns(
+    engine: Engine, metadata: MetaData
+) -> None:
+    # `create_all` skips existing tables, so columns added to the models
+    # later are appended to older databases here (nullable columns only)
+    inspector = inspect(engine)
+
+    with engine.begin() as conn:
+        for tbl in metadata.sorted_tables:
+            existing = {
+                c["name"] for c in inspector.get_columns(tbl.name)
+            }
+
+            for col in tbl.columns:
+                if col.name in existing or not col.nullable:
+                    continue
+
+                col_type = col.type.compile(dialect=engine.dialect)
+                conn.execute(
+                    text(
+                        f"ALTER TABLE {tbl.name} "
+                        f"ADD COLUMN {col.name} {col_type}"
+                    )
+                )
+
+
+def get_db_paths(paths: list[str] | None) -> list[pathlib.Path]:
+    if paths:
+        return [pathlib.Path(p) for p in paths]
+
+    return sorted(pathlib.Path(settings.SQLITE_DB_ROOT).glob("*.db"))
+
+
+def get_sessionmaker(engine: Engine) -> sessionmaker:
+    return sessionmaker(bind=engine)
 
 
 def get_engine(url: str, **kwargs: object) -> Engine:
@@ -33,6 +86,17 @@ def get_engine(url: str, **kwargs: object) -> Engine:
     return engine
 
 
+def enable_wal(engine: Engine, busy_timeout: int = 30000) -> None:
+    # readers (sheet/dash) no longer block the runner's writer and vice versa
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={busy_timeout}")
+        cursor.close()
+
+
 def insert_one(session: Session, value: dict, instance) -> None:
     with session:
         values_to_insert = instance(**value)
@@ -85,25 +149,30 @@ def upsert_one(
         session.commit()
 
 
+def upsert_statement(instance):
+    primary_keys = instance.__table__.primary_key.columns.keys()
+    columns = [
+        c
+        for c in instance.__table__.columns.keys()
+        if c not in primary_keys
+    ]
+
+    stmt = sqlite_upsert(instance)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=primary_keys,
+        set_={
+            c: getattr(stmt.excluded, c)
+            for c in columns
+        }
+    )
+    return stmt
+
+
 def upsert_many(
     session: Session, values: list[dict], instance
 ) -> None:
     with session:
-        primary_keys = instance.__table__.primary_key.columns.keys()
-        columns = [
-            c
-            for c in instance.__table__.columns.keys()
-            if c not in primary_keys
-        ]
-
-        stmt = sqlite_upsert(instance)
-        stmt = stmt.on_conflict_do_update(
-            index_elements=primary_keys,
-            set_={
-                c: getattr(stmt.excluded, c)
-                for c in columns
-            }
-        )
+        stmt = upsert_statement(instance)
 
         session.execute(statement=stmt, params=values)
         session.commit()
@@ -131,10 +200,12 @@ def select_by_column_names(
 
 
 def execute_select_statement(
-    session: Session, statement: str
+    session: Session,
+    statement: str,
+    params: dict[str, Any] | None = None
 ) -> list[dict]:
     with session:
-        results = session.execute(text(statement))
+        results = session.execute(text(statement), params)
 
         return [r._asdict() for r in results]
 
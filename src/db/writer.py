@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from typing import Any
+from typing import NamedTuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import sessionmaker
+
+from src import logger
+from src.config import settings
+from src.db import models
+from src.db import summary
+from src.db import utils
+
+
+UPSERT = "upsert"
+UPDATE = "update"
+
+_FLUSH = object()
+_CLOSE = object()
+
+
+class WriteOp(NamedTuple):
+    kind: str
+    instance: Any
+    rows: list[dict]
+
+
+class WriterStats:
+    def __init__(self) -> None:
+        self.rows = 0
+        self.flushes = 0
+        self.flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    def record(self, rows: int, seconds: float) -> None:
+        self.rows += rows
+        self.flushes += 1
+        self.flush_seconds += seconds
+        self.max_flush_seconds = max(self.max_flush_seconds, seconds)
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.flush_seconds == 0:
+            return 0.0
+        return self.rows / self.flush_seconds
+
+    @property
+    def mean_flush_seconds(self) -> float:
+        if self.flushes == 0:
+            return 0.0
+        return self.flush_seconds / self.flushes
+
+    def snapshot(self) -> dict:
+        return {
+            "rows": self.rows,
+            "flushes": self.flushes,
+            "rows_per_second": round(self.rows_per_second, 1),
+            "mean_flush_seconds": round(self.mean_flush_seconds, 4),
+            "max_flush_seconds": round(self.max_flush_seconds, 4),
+        }
+
+
+def write_batch(session: Session, ops: list[WriteOp]) -> None:
+    # consecutive ops for the same table/kind are merged into one
+    # executemany, all inside a single transaction
+    with session:
+        merged: list[WriteOp] = []
+        for op in ops:
+            if (
+                len(merged) > 0
+                and merged[-1].kind == op.kind
+                and merged[-1].instance is op.instance
+            ):
+                merged[-1].rows.extend(op.rows)
+            else:
+                merged.append(WriteOp(op.kind, op.instance, list(op.rows)))
+
+        for op in merged:
+            if op.kind == UPSERT:
+                stmt = utils.upsert_statement(op.instance)
+            else:
+                stmt = update(op.instance)
+
+            session.execute(stmt, op.rows)
+
+        if any(op.instance is models.ShopifyInventory for op in merged):
+            summary.fold_sales_summary(session)
+
+        session.commit()
+
+
+class BatchWriter:
+    # single write-behind sink: fetch workers enqueue rows, one task
+    # flushes them in large transactions on a worker thread
+    def __init__(
+        self,
+        session: sessionmaker,
+        batch_size: int = settings.WRITER_BATCH_SIZE,
+        flush_interval: float = settings.WRITER_FLUSH_INTERVAL,
+        queue_size: int = settings.WRITER_QUEUE_SIZE,
+    ) -> None:
+        self.session = session
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = WriterStats()
+        self.llogger = logger.get_logger("writer")
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def put(
+        self, instance: Any, rows: list[dict], kind: str = UPSERT
+    ) -> None:
+        if len(rows) == 0:
+            return
+        await self._queue.put(WriteOp(kind, instance, rows))
+
+    async def flush(self) -> None:
+        await self._queue.put(_FLUSH)
+        await self._queue.join()
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+
+        await self._queue.put(_CLOSE)
+        await self._task
+        self._task = None
+
+    async def _write(self, ops: list[WriteOp]) -> None:
+        if len(ops) == 0:
+            return
+
+        rows = sum(len(op.rows) for op in ops)
+        start = time.perf_counter()
+        await asyncio.to_thread(write_batch, self.session(), ops)
+        self.stats.record(rows=rows, seconds=time.perf_counter() - start)
+
+    async def run(self) -> None:
+        ops: list[WriteOp] = []
+        rows = 0
+        pending = 0
+        deadline = time.monotonic() + self.flush_interval
+
+        while True:
+            timeout = max(deadline - time.monotonic(), 0)
+            try:
+                item = await asyncio.wait_for(
+                    self._queue.get(), timeout=timeout
+                )
+                pending += 1
+            except asyncio.TimeoutError:
+                item = None
+
+            if isinstance(item, WriteOp):
+                ops.append(item)
+                rows += len(item.rows)
+
+            if (
+                item is None
+                or item is _FLUSH
+                or item is _CLOSE
+                or rows >= self.batch_size
+            ):
+                try:
+                    await self._write(ops)
+                except Exception:
+                    self.llogger.exception(
+                        msg=f"failed writing batch of {rows} row(s)"
+                    )
+                finally:
+                    for _ in range(pending):
+                        self._queue.task_done()
+
+                ops, rows, pending = [], 0, 0
+                deadline = time.monotonic() + self.flush_interval
+
+            if item is _CLOSE:
+                break
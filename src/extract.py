@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import html
+import re
+
+from typing import Iterator
+from typing import NamedTuple
+
+
+# tokens that matter when looking for <script> tags without a dom: comments
+# (their contents are skipped) and script/style start tags (their contents
+# are raw text up to the matching end tag, like `html.parser` cdata mode)
+_TOKEN_RE = re.compile(
+    r"""<!--.*?-->"""
+    r"""|<(?P<tag>script|style)(?=[\s/>])"""
+    r"""(?P<attrs>(?:[^>"']|"[^"]*"|'[^']*')*)>""",
+    flags=re.S | re.I
+)
+
+_END_TAG_RE = {
+    "script": re.compile(r"</\s*script\s*>", flags=re.I),
+    "style": re.compile(r"</\s*style\s*>", flags=re.I),
+}
+
+# same tolerant attribute grammar as `html.parser`
+_ATTR_RE = re.compile(
+    r"""((?<=['"\s/])[^\s/>][^\s/=>]*)(\s*=+\s*"""
+    r"""('[^']*'|"[^"]*"|(?!['"])[^>\s]*))?(?:\s|/(?!>))*"""
+)
+
+# attribute values `soupsieve` compares case-insensitively in html
+_CASE_INSENSITIVE_ATTRS = {"type", "language"}
+
+
+class ScriptTag(NamedTuple):
+    attrs: dict[str, str]
+    text: str
+    outer: str
+
+
+def parse_attrs(raw: str) -> dict[str, str]:
+    attrs = {}
+
+    for m in _ATTR_RE.finditer(" " + raw):
+        name, rest, value = m.group(1, 2, 3)
+        if not rest:
+            value = ""
+        elif value[:1] == value[-1:] and value[:1] in ("'", '"'):
+            value = value[1:-1]
+
+        attrs[name.lower()] = html.unescape(value)
+
+    return attrs
+
+
+def iter_scripts(markup: str | bytes) -> Iterator[ScriptTag]:
+    if isinstance(markup, bytes):
+        markup = markup.decode("utf-8", errors="replace")
+
+    pos = 0
+    while True:
+        m = _TOKEN_RE.search(markup, pos)
+        if m is None:
+            return
+
+        pos = m.end()
+        tag = m.group("tag")
+        if tag is None:
+            continue
+
+        raw_attrs = m.group("attrs")
+        if raw_attrs.rstrip().endswith("/"):
+            # `<script ... />` has no content in `html.parser`
+            if tag.lower() == "script":
+                yield ScriptTag(parse_attrs(raw_attrs), "", m.group(0))
+            continue
+
+        end = _END_TAG_RE[tag.lower()].search(markup, pos)
+        end_start = len(markup) if end is None else end.start()
+        end_end = len(markup) if end is None else end.end()
+
+        if tag.lower() == "script":
+            yield ScriptTag(
+                attrs=parse_attrs(raw_attrs),
+                text=markup[pos:end_start],
+                outer=markup[m.start():end_end],
+            )
+
+        pos = end_end
+
+
+def _match_attrs(
+    tag_attrs: dict[str, str],
+    attrs: dict[str, str | None],
+    exclude: tuple[str, ...]
+) -> bool:
+    for name, value in attrs.items():
+        if name not in tag_attrs:
+            return False
+
+        if value is None:
+            continue
+
+        actual = tag_attrs[name]
+        if name in _CASE_INSENSITIVE_ATTRS:
+            if actual.lower() != value.lower():
+                return False
+        elif actual != value:
+            return False
+
+    return not any(name in tag_attrs for name in exclude)
+
+
+def select_scripts(
+    markup: str | bytes,
+    attrs: dict[str, str | None] | None = None,
+    exclude: tuple[str, ...] = (),
+    contains: str | None = None
+) -> list[ScriptTag]:
+    # `attrs` maps attribute name -> exact value, or None for "present",
+    # `exclude` lists attributes that must be absent and `contains` is
+    # marker text the script body must include
+    if attrs is None:
+        attrs = {}
+
+    if isinstance(markup, bytes):
+        markup = markup.decode("utf-8", errors="replace")
+
+    # cheap substring checks skip pages that almost certainly cannot match,
+    # callers fall back to the full parser whenever nothing is found
+    if contains is not None and contains not in markup:
+        return []
+
+    for name, value in attrs.items():
+        if (
+            value is not None
+            and name not in _CASE_INSENSITIVE_ATTRS
+            and value not in markup
+        ):
+            return []
+
+    return [
+        s
+        for s in iter_scripts(markup)
+        if _match_attrs(s.attrs, attrs, exclude)
+        and (contains is None or contains in s.text)
+    ]
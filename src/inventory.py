@@ -1,10 +1,21 @@
 from __future__ import annotations
 
+import pathlib
+
+from typing import Iterator
+
 import pandas
+import pyarrow
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from adbc_driver_sqlite import dbapi as adbc_sqlite
 
 from sqlalchemy import Engine
+from sqlalchemy import text
 
 from src.config import settings
+from src.db import summary
 from src.db import utils
 
 _COMBINED_INVENTORY_STMT = """
@@ -35,99 +46,561 @@ LEFT JOIN variant_tbl AS vt
 WHERE i.inventory_quantity > 0 and vt.product_id not null
 """
 
-def calculate_item_sold_by_variants(
-    group: pandas.DataFrame
-) -> pandas.DataFrame:
-    item_sold = 0
-    values = group["inventory_quantity"].to_list()
-
-    for i, v in enumerate(values):
-        previous_v_id = 0 if i-1 <= 0 else i-1
-        changes = v - values[previous_v_id]
-
-        if changes < 0:
-            item_sold = item_sold - changes
-        else:
-            continue
-
-    last_updated = group["updated_at"].tail(1)
-    df = pandas.DataFrame(
-        data={
-            "last_updated": last_updated,
-            "item_sold": item_sold,
-        }
-    )
+# per-variant summary of the history, computed inside sqlite so only
+# one row per variant comes back to python (needs sqlite >= 3.25)
+_INVENTORY_SUMMARY_STMT = """
+WITH history AS (
+    SELECT
+        i.id,
+        i.variant_id,
+        i.inventory_quantity,
+        LAG(i.inventory_quantity) OVER (
+            PARTITION BY i.variant_id ORDER BY i.id
+        ) AS previous_quantity
+    FROM inventory AS i
+    JOIN variant AS v
+        ON v.id = i.variant_id
+    JOIN product AS p
+        ON p.id = v.product_id
+    WHERE i.inventory_quantity > 0
+),
+summary AS (
+    SELECT
+        variant_id,
+        COALESCE(
+            SUM(MAX(previous_quantity - inventory_quantity, 0)), 0
+        ) AS item_sold,
+        MIN(id) AS first_id,
+        MAX(id) AS last_id
+    FROM history
+    GROUP BY variant_id
+)
+SELECT
+    p.id AS product_id,
+    p.title AS product_title,
+    p.product_type,
+    s.variant_id,
+    v.title AS variant_title,
+    f.inventory_quantity AS initial_amount,
+    s.item_sold,
+    f.updated_at AS first_updated,
+    l.updated_at AS last_updated
+FROM summary AS s
+JOIN inventory AS f
+    ON f.id = s.first_id
+JOIN inventory AS l
+    ON l.id = s.last_id
+JOIN variant AS v
+    ON v.id = s.variant_id
+JOIN product AS p
+    ON p.id = v.product_id
+ORDER BY s.item_sold DESC, initial_amount DESC, s.variant_id
+"""
 
-    return df
 
+# reads the totals maintained at ingest time, O(variants)
+_SALES_SUMMARY_STMT = """
+SELECT
+    p.id AS product_id,
+    p.title AS product_title,
+    p.product_type,
+    s.variant_id,
+    v.title AS variant_title,
+    s.initial_amount,
+    s.item_sold,
+    s.first_updated,
+    s.last_updated
+FROM variant_sales_summary AS s
+JOIN variant AS v
+    ON v.id = s.variant_id
+JOIN product AS p
+    ON p.id = v.product_id
+ORDER BY s.item_sold DESC, s.initial_amount DESC, s.variant_id
+"""
 
-def compute_inventory(
-    engine: Engine
+
+_INVENTORY_COLUMNS = [
+    "product_id",
+    "product_title",
+    # "product_url",
+    "product_type",
+    "variant_id",
+    "variant_title",
+    "initial_amount",
+    "item_sold",
+    "first_updated",
+    "last_updated"
+]
+
+
+# history in recording order, so consecutive chunks continue every
+# variant's series where the previous chunk stopped
+_ORDERED_INVENTORY_STMT = _COMBINED_INVENTORY_STMT + "ORDER BY i.id\n"
+
+# repeated strings become categories, quantities fit in int32
+_CHUNK_DTYPES = {
+    "id": "int64",
+    "product_id": "int64",
+    "product_title": "category",
+    "product_url": "category",
+    "product_type": "category",
+    "variant_id": "int64",
+    "variant_title": "category",
+    "inventory_quantity": "int32",
+}
+
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def iter_inventory_chunks(
+    engine: Engine, chunksize: int = settings.INVENTORY_CHUNK_SIZE
+) -> Iterator[pandas.DataFrame]:
+    with engine.connect() as conn:
+        chunks = pandas.read_sql_query(
+            sql=text(_ORDERED_INVENTORY_STMT),
+            con=conn,
+            chunksize=chunksize,
+            dtype=_CHUNK_DTYPES
+        )
+
+        for chunk in chunks:
+            chunk["updated_at"] = pandas.to_datetime(
+                chunk["updated_at"], format="ISO8601"
+            )
+            yield chunk
+
+
+class InventoryAggregator:
+    # per-variant summary over the history in chunks: only one chunk
+    # plus O(variants) running state is held at any time
+    def __init__(self) -> None:
+        self.first_rows: list[pandas.DataFrame] = []
+        self.last_quantity = pandas.Series(dtype="int64")
+        self.last_updated = pandas.Series(dtype="datetime64[ns]")
+        self.item_sold = pandas.Series(dtype="int64")
+
+    def add(self, chunk: pandas.DataFrame) -> None:
+        if len(chunk) == 0:
+            return
+
+        data = chunk.sort_values(by=["variant_id", "id"], kind="stable")
+        variant_ids = data["variant_id"]
+        quantities = data["inventory_quantity"].astype("int64")
+
+        # a variant's first row in this chunk continues from the last
+        # quantity the previous chunks saw
+        previous = quantities.groupby(variant_ids, sort=False).shift()
+        is_first = previous.isna()
+        previous[is_first] = variant_ids[is_first].map(self.last_quantity)
+
+        decreases = (previous - quantities).clip(lower=0).fillna(0)
+        self.item_sold = self.item_sold.add(
+            decreases.groupby(variant_ids, sort=False).sum(),
+            fill_value=0
+        )
+
+        firsts = data.drop_duplicates(subset="variant_id", keep="first")
+        new = firsts[~firsts["variant_id"].isin(self.last_quantity.index)]
+        if len(new) > 0:
+            # back to plain strings, categories of separate chunks differ
+            self.first_rows.append(
+                new.astype(
+                    {
+                        c: new[c].cat.categories.dtype
+                        for c in new.select_dtypes("category")
+                    }
+                )
+            )
+
+        lasts = (
+            data.drop_duplicates(subset="variant_id", keep="last")
+            .set_index("variant_id")
+        )
+        self.last_quantity = (
+            lasts["inventory_quantity"].astype("int64")
+            .combine_first(self.last_quantity)
+        )
+        self.last_updated = lasts["updated_at"].combine_first(
+            self.last_updated
+        )
+
+    def result(self) -> pandas.DataFrame:
+        if len(self.first_rows) == 0:
+            return pandas.DataFrame(columns=_INVENTORY_COLUMNS)
+
+        df = (
+            pandas.concat(self.first_rows)
+            .sort_values(by="variant_id", kind="stable")
+            .drop(axis=1, labels=["id"])
+            .rename(
+                axis=1,
+                mapper={
+                    "updated_at": "first_updated",
+                    "inventory_quantity": "initial_amount"
+                }
+            )
+            .reset_index(drop=True)
+        )
+        df["initial_amount"] = df["initial_amount"].astype("int64")
+        df["item_sold"] = (
+            df["variant_id"].map(self.item_sold).astype("int64")
+        )
+        df["last_updated"] = df["variant_id"].map(self.last_updated)
+
+        # same text timestamps the other backends return (and gspread can
+        # serialize)
+        for col in ("first_updated", "last_updated"):
+            df[col] = df[col].dt.strftime(_TIMESTAMP_FORMAT)
+
+        df = df.sort_values(
+            by=["item_sold", "initial_amount"],
+            ascending=False
+        )
+
+        return df.loc[:, _INVENTORY_COLUMNS]
+
+
+def stream_inventory_summary(
+    engine: Engine, chunksize: int = settings.INVENTORY_CHUNK_SIZE
 ) -> pandas.DataFrame:
+    aggregator = InventoryAggregator()
+    for chunk in iter_inventory_chunks(engine, chunksize=chunksize):
+        aggregator.add(chunk)
+
+    return aggregator.result()
+
+
+# the arrow backend reads narrow history rows sorted per variant (the
+# covering index gives that order) and the variant names once, instead
+# of repeating names on every history row
+_ARROW_HISTORY_STMT = """
+SELECT
+    i.variant_id,
+    i.updated_at,
+    i.inventory_quantity
+FROM inventory AS i
+WHERE i.inventory_quantity > 0
+ORDER BY i.variant_id, i.id
+"""
+
+_ARROW_VARIANTS_STMT = """
+SELECT
+    p.id AS product_id,
+    p.title AS product_title,
+    p.product_type,
+    v.id AS variant_id,
+    v.title AS variant_title
+FROM variant AS v
+JOIN product AS p
+    ON p.id = v.product_id
+"""
+
+_ARROW_HISTORY_SCHEMA = pyarrow.schema(
+    [
+        ("variant_id", pyarrow.int64()),
+        ("updated_at", pyarrow.string()),
+        ("inventory_quantity", pyarrow.int64()),
+    ]
+)
+
+_ARROW_VARIANTS_SCHEMA = pyarrow.schema(
+    [
+        ("product_id", pyarrow.int64()),
+        ("product_title", pyarrow.string()),
+        ("product_type", pyarrow.string()),
+        ("variant_id", pyarrow.int64()),
+        ("variant_title", pyarrow.string()),
+    ]
+)
+
+
+def fetch_arrow_table(
+    engine: Engine,
+    statement: str,
+    schema: pyarrow.Schema,
+    params: tuple = (),
+    batch_size: int = settings.INVENTORY_CHUNK_SIZE
+) -> pyarrow.Table:
+    # the adbc sqlite driver reads the file into arrow batches without
+    # python row objects. engines without a file (in-memory databases)
+    # fall back to turning rows into columns `batch_size` at a time
+    if engine.url.database and engine.url.database != ":memory:":
+        try:
+            with adbc_sqlite.connect(engine.url.database) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(statement, params or None)
+                    return cursor.fetch_arrow_table().cast(schema)
+        except OSError:
+            # the driver infers column types from the first batch, a
+            # text column that is all NULL there is read as int64 and
+            # fails on the first string. the row path takes `schema`
+            pass
+
+    batches = []
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(statement, params)
 
-    utils.LocalSession.configure(bind=engine)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if len(rows) == 0:
+                break
 
-    inventories = utils.execute_select_statement(
-        session=utils.LocalSession(),
-        statement=_COMBINED_INVENTORY_STMT
+            columns = zip(*rows)
+            batches.append(
+                pyarrow.record_batch(
+                    [
+                        pyarrow.array(values, type=field.type)
+                        for values, field in zip(columns, schema)
+                    ],
+                    schema=schema
+                )
+            )
+    finally:
+        conn.close()
+
+    return pyarrow.Table.from_batches(batches, schema=schema)
+
+
+def summarize_inventory_table(
+    history: pyarrow.Table, variants: pyarrow.Table
+) -> pyarrow.Table:
+    # `history` must be sorted by (variant_id, id)
+    n = len(history)
+    if n == 0:
+        return pyarrow.table(
+            {c: pyarrow.array([], type=pyarrow.null()) for c in _INVENTORY_COLUMNS}
+        )
+
+    variant_ids = history["variant_id"]
+    quantities = history["inventory_quantity"]
+
+    # decrease from the previous row, only counted inside the same variant
+    same_variant = pc.equal(variant_ids.slice(1), variant_ids.slice(0, n - 1))
+    decreases = pc.max_element_wise(
+        pc.subtract(quantities.slice(0, n - 1), quantities.slice(1)), 0
     )
-    inventory_data = pandas.DataFrame(data=inventories)
-
-    def get_head(
-        group: pandas.DataFrame, n: int=1
-    ) -> pandas.DataFrame:
-        return group.head(n)
-
-    updated_inventory = (
-        inventory_data
-        .groupby("variant_id")[inventory_data.columns]
-        .apply(calculate_item_sold_by_variants, include_groups=False)
-        .reset_index(level=0, drop=False)
-        .fillna(0)
+    sold = pyarrow.chunked_array(
+        [pyarrow.array([0], type=pyarrow.int64())]
+        + pc.if_else(same_variant, decreases, 0).chunks,
+        type=pyarrow.int64()
     )
 
-    initial_inventory = (
-        inventory_data
-        .groupby("variant_id", as_index=False)[inventory_data.columns]
-        .apply(get_head)
-        .drop(axis=1, labels=["id"])
-        .reset_index(drop=True)
-        .rename(
-            axis=1,
-            mapper={
-                "updated_at": "first_updated",
-                "inventory_quantity": "initial_amount"
+    # without threads the group keeps row order, so first/last are the
+    # first and last recorded rows
+    summary = (
+        history.append_column("sold", sold)
+        .group_by("variant_id", use_threads=False)
+        .aggregate(
+            [
+                ("sold", "sum"),
+                ("inventory_quantity", "first"),
+                ("updated_at", "first"),
+                ("updated_at", "last"),
+            ]
+        )
+        .rename_columns(
+            {
+                "sold_sum": "item_sold",
+                "inventory_quantity_first": "initial_amount",
+                "updated_at_first": "first_updated",
+                "updated_at_last": "last_updated",
             }
         )
     )
 
-    df = (
-        pandas.merge(
-            left=initial_inventory,
-            right=updated_inventory,
-            how="left",
-            on="variant_id",
+    return (
+        variants.join(summary, keys="variant_id", join_type="inner")
+        .sort_by(
+            [
+                ("item_sold", "descending"),
+                ("initial_amount", "descending"),
+                ("variant_id", "ascending"),
+            ]
         )
-        .sort_values(
-            by=["item_sold", "initial_amount"],
-            ascending=False
+        .select(_INVENTORY_COLUMNS)
+    )
+
+
+def compute_inventory_table(
+    engine: Engine
+) -> pyarrow.Table:
+    return summarize_inventory_table(
+        history=fetch_arrow_table(
+            engine, _ARROW_HISTORY_STMT, _ARROW_HISTORY_SCHEMA
+        ),
+        variants=fetch_arrow_table(
+            engine, _ARROW_VARIANTS_STMT, _ARROW_VARIANTS_SCHEMA
+        ),
+    )
+
+
+# `st-archive` (src/archive.py) layout: <root>/inventory/store=<db name>/
+# month=<YYYY-MM>/*.parquet with the raw inventory rows, and the latest
+# variant names in <root>/variants/store=<db name>/
+_ARCHIVE_PARTITIONING = ds.partitioning(
+    pyarrow.schema([("store", pyarrow.string()), ("month", pyarrow.string())]),
+    flavor="hive"
+)
+
+
+def get_archive_store(engine: Engine) -> str:
+    # the archive partition is named after the database file
+    return pathlib.Path(engine.url.database).stem
+
+
+def compute_archive_table(
+    store: str,
+    since: str | None = None,
+    until: str | None = None,
+    root: pathlib.Path = settings.ARCHIVE_ROOT
+) -> pyarrow.Table:
+    # same summary from the parquet archive, the live database is not
+    # read at all. store/month filters only open the matching partitions,
+    # the quantity filter is checked against row group statistics
+    history_filter = (
+        (ds.field("store") == store)
+        & (ds.field("inventory_quantity") > 0)
+    )
+    if since is not None:
+        history_filter &= ds.field("month") >= since
+    if until is not None:
+        history_filter &= ds.field("month") <= until
+
+    history = (
+        ds.dataset(
+            root / "inventory",
+            format="parquet",
+            partitioning=_ARCHIVE_PARTITIONING
+        )
+        .to_table(
+            columns=["id", *_ARROW_HISTORY_SCHEMA.names],
+            filter=history_filter
         )
+        .sort_by([("variant_id", "ascending"), ("id", "ascending")])
+    )
+    variants = ds.dataset(
+        root / "variants",
+        format="parquet",
+        partitioning=_ARCHIVE_PARTITIONING
+    ).to_table(
+        columns=_ARROW_VARIANTS_SCHEMA.names,
+        filter=ds.field("store") == store
     )
 
-    cols = [
-        "product_id",
-        "product_title",
-        # "product_url",
-        "product_type",
-        "variant_id",
-        "variant_title",
-        "initial_amount",
-        "item_sold",
-        "first_updated",
-        "last_updated"
-    ]
+    return summarize_inventory_table(
+        history=history.select(_ARROW_HISTORY_SCHEMA.names).cast(
+            _ARROW_HISTORY_SCHEMA
+        ),
+        variants=variants.cast(_ARROW_VARIANTS_SCHEMA),
+    )
+
+
+def to_records(df: pandas.DataFrame) -> list[dict]:
+    # json-ready rows for dash/gspread, missing values become None
+    return pyarrow.Table.from_pandas(df, preserve_index=False).to_pylist()
+
+
+def to_rows(df: pandas.DataFrame) -> list[list]:
+    table = pyarrow.Table.from_pandas(df, preserve_index=False)
+    return [list(row) for row in zip(*table.to_pydict().values())]
+
+
+def query_inventory_summary(
+    engine: Engine
+) -> pandas.DataFrame:
+    session = utils.get_sessionmaker(engine)
+
+    summary = utils.execute_select_statement(
+        session=session(),
+        statement=_INVENTORY_SUMMARY_STMT
+    )
+
+    return pandas.DataFrame(data=summary, columns=_INVENTORY_COLUMNS)
+
+
+def read_sales_summary(
+    engine: Engine
+) -> pandas.DataFrame:
+    # a sessionmaker per engine, the process-wide `LocalSession` would be
+    # rebound under concurrent dash callbacks for other stores
+    session = utils.get_sessionmaker(engine)
+    summary.refresh_sales_summary(session=session())
+
+    sales = utils.execute_select_statement(
+        session=session(),
+        statement=_SALES_SUMMARY_STMT
+    )
+
+    return pandas.DataFrame(data=sales, columns=_INVENTORY_COLUMNS)
+
+
+def compute_inventory(
+    engine: Engine, backend: str | None = None
+) -> pandas.DataFrame:
+    # "summary" reads the table kept up to date at ingest time, "sql"
+    # aggregates the history inside sqlite, "arrow" and "pandas" pull it
+    # through arrow compute kernels or in pandas chunks, "archive" reads
+    # the parquet archive instead of the database
+    if backend is None:
+        backend = settings.INVENTORY_BACKEND
+
+    if backend == "summary":
+        return read_sales_summary(engine)
+
+    if backend == "sql":
+        return query_inventory_summary(engine)
 
-    return df.loc[:, cols]
+    if backend == "arrow":
+        # arrow-backed columns, nothing is converted to python objects
+        return compute_inventory_table(engine).to_pandas(
+            types_mapper=pandas.ArrowDtype
+        )
+
+    if backend == "archive":
+        return compute_archive_table(
+            store=get_archive_store(engine)
+        ).to_pandas(types_mapper=pandas.ArrowDtype)
+
+    return stream_inventory_summary(engine)
+
+
+_QUANTITY_AS_OF_STMT = """
+SELECT
+    i.variant_id,
+    i.inventory_quantity,
+    i.updated_at,
+    i.run_id
+FROM inventory AS i
+JOIN (
+    SELECT MAX(id) AS id
+    FROM inventory
+    WHERE COALESCE(run_id, 0) <= :run_id
+    GROUP BY variant_id
+) AS last
+    ON last.id = i.id
+"""
+
+
+def quantity_as_of(
+    engine: Engine, run_id: int
+) -> pandas.DataFrame:
+    # the last recorded quantity of every variant up to run `run_id`,
+    # works the same for "full" and change-only ("changes") storage.
+    # rows from before runs were tracked count as older than any run
+    session = utils.get_sessionmaker(engine)
+
+    quantities = utils.execute_select_statement(
+        session=session(),
+        statement=_QUANTITY_AS_OF_STMT,
+        params={"run_id": run_id}
+    )
+
+    return pandas.DataFrame(
+        data=quantities,
+        columns=["variant_id", "inventory_quantity", "updated_at", "run_id"]
+    )
 
 
 def main() -> None:
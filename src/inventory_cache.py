@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import collections
+import hashlib
+import os
+import pathlib
+import threading
+
+import pandas
+
+from sqlalchemy import Engine
+from sqlalchemy import text
+
+from src import archive
+from src import inventory
+from src.config import settings
+
+
+def get_archive_watermark(
+    engine: Engine, root: pathlib.Path = settings.ARCHIVE_ROOT
+) -> tuple:
+    # `st-archive` moves the store's id watermark, and rewrites the names
+    # snapshot on every run. the live database is never opened
+    store = inventory.get_archive_store(engine)
+    variants = (
+        archive.get_store_root(root, "variants", store) / "variants.parquet"
+    )
+
+    try:
+        mtime = os.stat(variants).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+
+    return (archive.get_watermark(root, store), mtime)
+
+
+def get_watermark(engine: Engine, backend: str | None = None) -> tuple:
+    if backend == "archive":
+        return get_archive_watermark(engine)
+
+    # new inventory rows move MAX(id), any other write (catalog upserts,
+    # run records, retention) touches the database or its wal file
+    with engine.connect() as conn:
+        max_id = conn.execute(text("SELECT MAX(id) FROM inventory")).scalar()
+
+    mtimes = []
+    db_path = engine.url.database
+    if db_path:
+        for suffix in ("", "-wal"):
+            try:
+                mtimes.append(os.stat(db_path + suffix).st_mtime_ns)
+            except FileNotFoundError:
+                mtimes.append(None)
+
+    return (max_id, *mtimes)
+
+
+class InventoryCache:
+    # lru of `compute_inventory` results keyed by (database, backend) and
+    # only valid for the watermark they were computed at
+    def __init__(
+        self,
+        max_entries: int = settings.INVENTORY_CACHE_SIZE,
+        disk_root: pathlib.Path | None = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.disk_root = disk_root
+
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _disk_path(self, key: tuple, watermark: tuple) -> pathlib.Path:
+        name = pathlib.Path(key[0]).stem
+        digest = hashlib.blake2b(
+            repr((key, watermark)).encode("utf-8"), digest_size=8
+        ).hexdigest()
+
+        return self.disk_root / f"{name}-{key[1]}-{digest}.parquet"
+
+    def get(self, key: tuple, watermark: tuple) -> pandas.DataFrame | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == watermark:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        if self.disk_root is not None:
+            fp = self._disk_path(key, watermark)
+            if fp.exists():
+                # arrow backend results come back with arrow dtypes
+                options = {}
+                if key[1] == "arrow":
+                    options["dtype_backend"] = "pyarrow"
+                df = pandas.read_parquet(fp, **options)
+                self.put(key, watermark, df, persist=False)
+                self.hits += 1
+                return df
+
+        self.misses += 1
+        return None
+
+    def put(
+        self,
+        key: tuple,
+        watermark: tuple,
+        df: pandas.DataFrame,
+        persist: bool = True
+    ) -> None:
+        with self._lock:
+            self._entries[key] = (watermark, df)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        if self.disk_root is not None and persist:
+            self.disk_root.mkdir(parents=True, exist_ok=True)
+
+            fp = self._disk_path(key, watermark)
+            # results for older watermarks of this database are stale
+            for old in self.disk_root.glob(fp.name.rsplit("-", 1)[0] + "-*"):
+                old.unlink(missing_ok=True)
+
+            df.to_parquet(fp, index=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_CACHE = InventoryCache(
+    disk_root=(
+        settings.INVENTORY_CACHE_ROOT
+        if settings.INVENTORY_CACHE_DISK
+        else None
+    )
+)
+
+
+def get_inventory(
+    engine: Engine, backend: str | None = None
+) -> pandas.DataFrame:
+    # `inventory.compute_inventory`, recomputed only when the database
+    # changed since the cached result was taken
+    if backend is None:
+        backend = settings.INVENTORY_BACKEND
+
+    key = (str(engine.url), backend)
+    watermark = get_watermark(engine, backend=backend)
+
+    df = _CACHE.get(key, watermark)
+    if df is None:
+        df = inventory.compute_inventory(engine, backend=backend)
+        _CACHE.put(key, watermark, df)
+
+    # callers are free to modify what they get back
+    return df.copy()
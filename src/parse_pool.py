@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import multiprocessing
+import sys
+
+from src import parsers
+from src.config import settings
+
+
+class ParserPool:
+    # runs the cpu-bound html parsers on other cores, so the event loop
+    # only hands bytes over and gets `list[dict]` back
+    def __init__(
+        self,
+        max_workers: int = settings.PARSER_WORKERS,
+        max_tasks_per_child: int = settings.PARSER_MAX_TASKS_PER_CHILD,
+    ) -> None:
+        kwargs: dict = {
+            "max_workers": max_workers,
+            "mp_context": multiprocessing.get_context("spawn"),
+        }
+
+        # recycled workers keep bs4/parser memory from building up
+        if sys.version_info >= (3, 11):
+            kwargs["max_tasks_per_child"] = max_tasks_per_child
+
+        self.executor = concurrent.futures.ProcessPoolExecutor(**kwargs)
+
+    async def parse(
+        self, parser_name: str, content: bytes, encoding: str = "utf-8"
+    ) -> list[dict]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            parsers.parse_markup,
+            parser_name,
+            content,
+            encoding,
+        )
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def uses_parser_pool(parser_name: str) -> bool:
+    # json payloads decode faster in-loop than they pickle across processes
+    parser_class = parsers.get_parser_class(parser_name)
+    return (
+        settings.PARSER_WORKERS > 0
+        and not getattr(parser_class, "json_payload", False)
+    )
+
+
+def get_parser_pool(parser_names: list[str]) -> ParserPool | None:
+    if any(uses_parser_pool(name) for name in parser_names):
+        return ParserPool()
+
+    return None
@@ -2,9 +2,12 @@ from __future__ import annotations
 
 import re
 import json
+import codecs
 
 import bs4
 
+from src import extract
+
 from typing import NamedTuple
 from typing import Protocol
 from typing import runtime_checkable
@@ -24,6 +27,7 @@ _REQUIRED_VARIANT_COLUMNS = [
     "id",
     "title",
     "product_id",
+    "available",
 ]
 
 _REQUIRED_INVENTORY_COLUMNS = [
@@ -84,6 +88,8 @@ class ShopifyProductsParser:
         self.response = response
         self.products: list[dict] = []
         self.variants: list[dict] = []
+        # only filled for stores whose catalog exposes stock levels
+        self.inventory: list[dict] = []
 
     def parse_products(self, base_url: str) -> None:
         product_items = self.response["products"]
@@ -115,10 +121,153 @@ class ShopifyProductsParser:
             variant = filter_dict_items(
                 item=v, includes=_REQUIRED_VARIANT_COLUMNS
             )
+            # not every storefront exposes it, rows of one batch must
+            # still share the same keys
+            variant.setdefault("available", None)
             self.variants.append(variant)
 
+            if v.get("inventory_quantity") is not None:
+                self.inventory.append(
+                    {
+                        "variant_id": v["id"],
+                        "inventory_quantity": v["inventory_quantity"],
+                    }
+                )
+
+
+class ProductsStreamDecoder:
+    # incrementally decodes a `/products.json` body fed in arbitrary byte
+    # chunks, yielding one filtered product at a time so the whole page is
+    # never materialized; `body_html` is blanked before decoding
+    _START_RE = re.compile(r'"products"\s*:\s*\[')
+    _SKIP_RE = re.compile(r"[\s,]*")
+    _SKIPPED_KEY = '"body_html"'
+    _VALUE_START_RE = re.compile(r'\s*:\s*"')
+
+    def __init__(self, includes: list[str] | None = None) -> None:
+        self.includes = (
+            _REQUIRED_PRODUCT_COLUMNS if includes is None else includes
+        )
+        self.done = False
+
+        self._buffer = ""
+        self._retry_at = 0
+        self._started = False
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+
+    def feed(self, chunk: bytes) -> list[dict]:
+        if self.done:
+            return []
+
+        self._buffer += self._utf8.decode(chunk)
+
+        # a failed attempt costs about one product, so wait for the buffer
+        # to double before retrying; keeps tiny chunks from going quadratic
+        if len(self._buffer) < self._retry_at:
+            return []
+
+        return self._decode()
+
+    def _decode(self) -> list[dict]:
+        if not self._started:
+            m = self._START_RE.search(self._buffer)
+            if m is None:
+                self._retry_at = 2 * len(self._buffer)
+                return []
+
+            self._started = True
+            self._buffer = self._buffer[m.end():]
+
+        self._buffer = self._blank_skipped_strings(self._buffer)
+
+        products = []
+        pos = 0
+
+        while True:
+            pos = self._SKIP_RE.match(self._buffer, pos).end()
+            if pos >= len(self._buffer):
+                break
+
+            if self._buffer[pos] == "]":
+                self.done = True
+                break
+
+            try:
+                product, pos = self._decoder.raw_decode(self._buffer, pos)
+            except json.JSONDecodeError:
+                # the rest of this product has not arrived yet
+                break
+
+            products.append(
+                filter_dict_items(item=product, includes=self.includes)
+            )
+
+        self._buffer = self._buffer[pos:]
+        self._retry_at = 2 * len(self._buffer)
+        return products
+
+    def _blank_skipped_strings(self, buffer: str) -> str:
+        # replaces complete `"body_html": "..."` values with null using
+        # str.find only, so the large html strings are never decoded
+        pieces = []
+        start = 0
+        idx = buffer.find(self._SKIPPED_KEY)
+
+        while idx != -1:
+            m = self._VALUE_START_RE.match(
+                buffer, idx + len(self._SKIPPED_KEY)
+            )
+            if m is None:
+                # already blanked (or not a string value)
+                idx = buffer.find(self._SKIPPED_KEY, idx + 1)
+                continue
+
+            end = m.end()
+            while True:
+                end = buffer.find('"', end)
+                if end == -1:
+                    break
+
+                backslashes = 0
+                while buffer[end - 1 - backslashes] == "\\":
+                    backslashes += 1
+
+                if backslashes % 2 == 0:
+                    break
+                end += 1
+
+            if end == -1:
+                # value still streaming in, try again on the next chunk
+                break
+
+            pieces.append(buffer[start:m.start()])
+            pieces.append(":null")
+            start = end + 1
+            idx = buffer.find(self._SKIPPED_KEY, start)
+
+        if start == 0:
+            return buffer
+
+        pieces.append(buffer[start:])
+        return "".join(pieces)
+
+    def close(self) -> list[dict]:
+        products = [] if self.done else self._decode()
+
+        if not self._started:
+            raise ValueError("response has no `products` array")
+
+        if not self.done:
+            raise ValueError("truncated `products` array")
+
+        return products
+
 
 class JSONParser:
+    # the payload is json, decoded in-loop (see src/parse_pool.py)
+    json_payload = True
+
     def parse(self, markup: str | bytes) -> list[dict]:
         variant_details = json.loads(markup)["product"]["variants"]
         inventory = []
@@ -142,24 +291,46 @@ class HTMLParser(Protocol):
         ...
 
 
+def filter_markup(parser: Any, markup: str | bytes) -> Any:
+    # parsers with `fast_extract = True` pull their <script> out of the raw
+    # markup first and only build the full soup when that finds nothing
+    if getattr(parser, "fast_extract", False):
+        filtered = parser.fast_filter(markup)
+        if filtered is not None:
+            return filtered
+
+    soup = bs4.BeautifulSoup(markup=markup, features="html.parser")
+    return parser.filter(soup)
+
+
 class HTMLSwymParser(HTMLParser):
-    def filter(self, soup: bs4.BeautifulSoup) -> list[str]:
-        s = soup.select(selector="script#swym-snippet")[0]
+    fast_extract = True
+
+    def _split(self, script: str) -> list[str]:
         raw_variants = []
 
-        for i in str(s).split(";"):
+        for i in script.split(";"):
             if "SwymProductVariants[" in i:
                 raw_variants.append(i)
 
         return raw_variants
 
-    def parse(self, markup: str | bytes) -> list[dict]:
-        soup = bs4.BeautifulSoup(
-            markup=markup, features="html.parser"
+    def filter(self, soup: bs4.BeautifulSoup) -> list[str]:
+        s = soup.select(selector="script#swym-snippet")[0]
+        return self._split(str(s))
+
+    def fast_filter(self, markup: str | bytes) -> list[str] | None:
+        scripts = extract.select_scripts(
+            markup, attrs={"id": "swym-snippet"}
         )
+        if len(scripts) == 0:
+            return None
+        return self._split(scripts[0].outer)
+
+    def parse(self, markup: str | bytes) -> list[dict]:
         inventory = []
 
-        for v in self.filter(soup):
+        for v in filter_markup(self, markup):
             p = v.replace("\n", "").strip().split(",")
 
             variant_id = 0
@@ -191,12 +362,25 @@ class HTMLSwymParser(HTMLParser):
 
 
 class HTMLGloboParser(HTMLParser):
+    fast_extract = True
+
     def filter(self, soup: bs4.BeautifulSoup) -> list[str]:
         selector = "script[type='text/javascript'][hs-ignore]"
         script = soup.select(selector)[0]
+        return self._split(str(script.text))
+
+    def fast_filter(self, markup: str | bytes) -> list[str] | None:
+        scripts = extract.select_scripts(
+            markup, attrs={"type": "text/javascript", "hs-ignore": None}
+        )
+        if len(scripts) == 0:
+            return None
+        return self._split(scripts[0].text)
+
+    def _split(self, script: str) -> list[str]:
         raw_variants = []
 
-        for i in str(script.text).split(";"):
+        for i in script.split(";"):
             if ("GloboPreorderParams.product.variants" in i
                 and "inventory_policy" not in i
                 and "metafields" not in i
@@ -207,10 +391,7 @@ class HTMLGloboParser(HTMLParser):
 
     def parse(self, markup: str | bytes) -> list[dict]:
         inventory = []
-        soup = bs4.BeautifulSoup(
-            markup=markup, features="html.parser"
-        )
-        vs = self.filter(soup)
+        vs = filter_markup(self, markup)
         ps = list(zip(vs[:-1], vs[1:]))[::2]
 
         for v in ps:
@@ -228,30 +409,38 @@ class HTMLGloboParser(HTMLParser):
 
 
 class HTMLSpuritParser(HTMLParser):
-    def filter(self, soup: bs4.BeautifulSoup) -> list[str]:
+    fast_extract = True
+    marker = "Spurit.CountdownTimer.snippet.productId"
+
+    def _split(self, script: str) -> list[str]:
         raw_variants = []
 
+        for i in script.split(";"):
+            if "variantStock[" in i:
+                raw_variants.append(i)
+
+        return raw_variants
+
+    def filter(self, soup: bs4.BeautifulSoup) -> list[str]:
         scripts = soup.find_all(name="script")
         ss = [
             s
             for s in scripts
-            if "Spurit.CountdownTimer.snippet.productId" in s.text
+            if self.marker in s.text
         ]
         script = ss[-1]
 
-        for i in str(script.text).split(";"):
-            if "variantStock[" in i:
-                raw_variants.append(i)
+        return self._split(str(script.text))
 
-        return raw_variants
+    def fast_filter(self, markup: str | bytes) -> list[str] | None:
+        scripts = extract.select_scripts(markup, contains=self.marker)
+        if len(scripts) == 0:
+            return None
+        return self._split(scripts[-1].text)
 
     def parse(self, markup: str | bytes) -> list[dict]:
-        soup = bs4.BeautifulSoup(
-            markup=markup, features="html.parser"
-        )
-
         inventory = []
-        for v in self.filter(soup):
+        for v in filter_markup(self, markup):
             p = v.replace("\n", "").strip().split(",")
             variant_id = p[0].split(": ")[-1]
             inventory_quantity = p[1].split(": ")[-1]
@@ -267,33 +456,58 @@ class HTMLSpuritParser(HTMLParser):
 
 
 class HTMLBISParser(HTMLParser):
-    def filter(self, soup: bs4.BeautifulSoup) -> list[str]:
-        script, = soup.select("script#back-in-stock-helper")
+    fast_extract = True
+
+    def _split(self, script: str) -> list[str]:
         f = []
 
-        for line in str(script.text).split(";"):
+        for line in script.split(";"):
             if "_BISConfig.product.variants[" in line:
                 f.append(line.strip())
         return f
 
-    def _parse_variant_ids(
-        self, soup: bs4.BeautifulSoup
-    ) -> list[int | str]:
+    def _load_variant_ids(self, script: str) -> list[int | str]:
         variant_ids = []
-        script, = soup.select("script#em_product_variants")
-        variants = json.loads(s=script.text)
-        
+        variants = json.loads(s=script)
+
         for v in variants:
             variant_ids.append(v["id"])
-            
+
         return variant_ids
 
-    def parse(self, markup: str | bytes) -> list[dict]:
-        soup = bs4.BeautifulSoup(
-            markup=markup, features="html.parser"
-        )
+    def filter(
+        self, soup: bs4.BeautifulSoup
+    ) -> tuple[list[int | str], list[str]]:
         variant_ids = self._parse_variant_ids(soup)
-        vs = self.filter(soup)
+        script, = soup.select("script#back-in-stock-helper")
+
+        return variant_ids, self._split(str(script.text))
+
+    def fast_filter(
+        self, markup: str | bytes
+    ) -> tuple[list[int | str], list[str]] | None:
+        variants = extract.select_scripts(
+            markup, attrs={"id": "em_product_variants"}
+        )
+        helpers = extract.select_scripts(
+            markup, attrs={"id": "back-in-stock-helper"}
+        )
+        if len(variants) != 1 or len(helpers) != 1:
+            return None
+
+        return (
+            self._load_variant_ids(variants[0].text),
+            self._split(helpers[0].text)
+        )
+
+    def _parse_variant_ids(
+        self, soup: bs4.BeautifulSoup
+    ) -> list[int | str]:
+        script, = soup.select("script#em_product_variants")
+        return self._load_variant_ids(script.text)
+
+    def parse(self, markup: str | bytes) -> list[dict]:
+        variant_ids, vs = filter_markup(self, markup)
 
         inventory = []
 
@@ -336,18 +550,25 @@ class HTMLSasoParser(HTMLParser):
 
 
 class HTMLGeneralParser(HTMLParser):
+    fast_extract = True
+
     def filter(self, soup: bs4.BeautifulSoup) -> str:
         script, = soup.select("script#product-data")
         return script.text
 
-    def parse(self, markup: str | bytes) -> list[dict]:
-        soup = bs4.BeautifulSoup(
-            markup=markup, features="html.parser"
+    def fast_filter(self, markup: str | bytes) -> str | None:
+        scripts = extract.select_scripts(
+            markup, attrs={"id": "product-data"}
         )
+        if len(scripts) != 1:
+            return None
+        return scripts[0].text
+
+    def parse(self, markup: str | bytes) -> list[dict]:
         inventory: list[dict] = []
 
         try:
-            raw_variants = json.loads(s=self.filter(soup))
+            raw_variants = json.loads(s=filter_markup(self, markup))
 
             for v in raw_variants["product"]["variants"]:
                 inventory.append(
@@ -366,16 +587,28 @@ class HTMLGeneralParser(HTMLParser):
 
 
 class HTMLOptParser(HTMLParser):
+    fast_extract = True
+    marker = "var PRODUCT_JSON = function() {"
+
     def filter(self, soup: bs4.BeautifulSoup) -> str:
         scripts = soup.select("script")
         ss = []
 
         for s in scripts:
-            if "var PRODUCT_JSON = function() {" in s.text:
+            if self.marker in s.text:
                 ss = s.text.split("\n")
             else:
                 continue
 
+        return self._find_json(ss)
+
+    def fast_filter(self, markup: str | bytes) -> str | None:
+        scripts = extract.select_scripts(markup, contains=self.marker)
+        if len(scripts) == 0:
+            return None
+        return self._find_json(scripts[-1].text.split("\n"))
+
+    def _find_json(self, ss: list[str]) -> str:
         raw_variants = ""
         for line in ss:
             if ("p_json = {" in line and "var p_json" not in line):
@@ -386,13 +619,10 @@ class HTMLOptParser(HTMLParser):
         return raw_variants
 
     def parse(self, markup: str | bytes) -> list[dict]:
-        soup = bs4.BeautifulSoup(
-            markup=markup, features="html.parser"
-        )
         inventory = []
 
         try:
-            raw_variants = json.loads(s=self.filter(soup))
+            raw_variants = json.loads(s=filter_markup(self, markup))
             for v in raw_variants["variants"]:
                 inventory.append(
                     {
@@ -410,18 +640,25 @@ class HTMLOptParser(HTMLParser):
 
 
 class HTMLProdParser(HTMLParser):
+    fast_extract = True
+
     def filter(self, soup: bs4.BeautifulSoup) -> str:
         script, = soup.select("script#ProductJson-product-template")
         return script.text
 
-    def parse(self, markup: str | bytes) -> list[dict]:
-        soup = bs4.BeautifulSoup(
-            markup=markup, features="html.parser"
+    def fast_filter(self, markup: str | bytes) -> str | None:
+        scripts = extract.select_scripts(
+            markup, attrs={"id": "ProductJson-product-template"}
         )
+        if len(scripts) != 1:
+            return None
+        return scripts[0].text
+
+    def parse(self, markup: str | bytes) -> list[dict]:
         inventory: list[dict] = []
 
         try:
-            raw_variants = json.loads(s=self.filter(soup))
+            raw_variants = json.loads(s=filter_markup(self, markup))
 
             for v in raw_variants["variants"]:
                 inventory.append(
@@ -445,18 +682,32 @@ class HTMLProdParser(HTMLParser):
 
 
 class HTMLCamoParser(HTMLParser):
+    fast_extract = True
+
     def filter(
         self, soup: bs4.BeautifulSoup
     ) -> tuple[list, list]:
         script, = soup.select(
             selector="script[class='camouflage-script']:not([src])"
         )
+        return self._split(script.text)
+
+    def fast_filter(
+        self, markup: str | bytes
+    ) -> tuple[list, list] | None:
+        scripts = extract.select_scripts(
+            markup, attrs={"class": "camouflage-script"}, exclude=("src",)
+        )
+        if len(scripts) != 1:
+            return None
+        return self._split(scripts[0].text)
 
+    def _split(self, script: str) -> tuple[list, list]:
         raw_variants = ""
         variants = []
         inventory = []
 
-        for line in script.text.split(";"):
+        for line in script.split(";"):
             if "const camouflage_product" in line and "hide_oos_variant_qty" not in line:
                 raw_variants = line.split(" = ")[-1]
 
@@ -472,11 +723,10 @@ class HTMLCamoParser(HTMLParser):
         return variants, inventory
 
     def parse(self, markup: str | bytes) -> list[dict]:
-        soup = bs4.BeautifulSoup(markup=markup, features="html.parser")
         inventory: list[dict] = []
 
         try:
-            variants, inventory_array = self.filter(soup)
+            variants, inventory_array = filter_markup(self, markup)
             for v, i in zip(variants, inventory_array):
                 v.update({"inventory_quantity": i})
                 inventory.append(v)
@@ -516,15 +766,28 @@ class HTMLPOParser(HTMLParser):
         return inventory
     
 class HTMLEasyStockParser(HTMLParser):
-      
+    # the endpoint takes a comma separated list of handles in `q` and
+    # answers with one `products[handle]` entry per handle
+    batch_size = 25
+    json_payload = True
+
+    @staticmethod
+    def get_handles(markup: str | bytes) -> set[str]:
+        return set(json.loads(markup)["products"])
+
     def parse(self, markup: str | bytes) -> list[dict]:
-      
-        product_include_quantity_json=json.loads(markup)
-        product_handle = list(product_include_quantity_json['products'].keys())[0]
-        variants = product_include_quantity_json['products'][product_handle]["variants"]
-        return [{"variant_id":i["id"],"inventory_quantity":i["quantity"]} for i in variants]
-    
-    
+        product_include_quantity_json = json.loads(markup)
+        inventory: list[dict] = []
+
+        for product in product_include_quantity_json["products"].values():
+            inventory.extend(
+                {"variant_id": i["id"], "inventory_quantity": i["quantity"]}
+                for i in product["variants"]
+            )
+
+        return inventory
+
+
 class HTMLShopifyBlockParser(HTMLParser):
     def parse(self, markup: str | bytes) -> list[dict]:
         inventory: list[dict]=[]
@@ -544,6 +807,27 @@ class HTMLShopifyBlockParser(HTMLParser):
         )   
         return inventory
     
+def get_parser_class(
+    name: str
+) -> type[HTMLParser | JSONParser]:
+    for s in HTMLParser.__subclasses__():
+        if s.__name__ == name:
+            return s
+        else:
+            continue
+
+    return JSONParser
+
+
+def parse_markup(
+    parser_name: str, content: bytes, encoding: str = "utf-8"
+) -> list[dict]:
+    # entry point for worker processes: only the raw bytes cross the
+    # process boundary and are decoded the same way `httpx` would
+    markup = content.decode(encoding, errors="replace")
+    return get_parser_class(parser_name)().parse(markup=markup)
+
+
 def main() -> None:
     # response = pathlib.Path("data/json/products.json").read_text(encoding="utf-8")
     # response = json.loads(response)
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import random
+import time
+
+from typing import Any
+from typing import NamedTuple
+
+from src.config import settings
+
+
+class RetryItem(NamedTuple):
+    due: float
+    seq: int
+    attempt: int
+    item: Any
+
+
+class RetryQueue:
+    # min-heap keyed by the next attempt time, so a throttled fetch waits
+    # here instead of holding a worker/concurrency slot
+    def __init__(
+        self,
+        max_attempts: int = settings.MAX_RETRIES,
+        budget: int = settings.RETRY_BUDGET,
+        base_delay: float = settings.RETRY_SLEEP_DELAY,
+        max_delay: float = settings.MAX_RETRY_DELAY,
+    ) -> None:
+        self.max_attempts = max_attempts
+        self.budget = budget
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._heap: list[RetryItem] = []
+        self._seq = itertools.count()
+        # set when a push becomes the earliest item, a sleeping dispatcher
+        # wakes up and re-reads next_due_in()
+        self._wakeup = asyncio.Event()
+
+        self.scheduled = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def backoff(self, attempt: int) -> float:
+        delay = self.base_delay * 2 ** (attempt - 1)
+        delay = min(delay, self.max_delay)
+        return delay + random.uniform(0, delay / 2)
+
+    def push(
+        self,
+        item: Any,
+        attempt: int,
+        delay: float | None = None
+    ) -> bool:
+        if attempt >= self.max_attempts or self.budget <= 0:
+            self.dropped += 1
+            return False
+
+        if delay is None:
+            delay = self.backoff(attempt)
+
+        self.budget -= 1
+        self.scheduled += 1
+
+        retry = RetryItem(
+            due=time.monotonic() + delay,
+            seq=next(self._seq),
+            attempt=attempt,
+            item=item,
+        )
+        heapq.heappush(self._heap, retry)
+        if self._heap[0] is retry:
+            self._wakeup.set()
+
+        return True
+
+    def next_due_in(self) -> float | None:
+        if len(self._heap) == 0:
+            return None
+        return max(self._heap[0].due - time.monotonic(), 0.0)
+
+    async def wait_due(self) -> None:
+        # sleeps until the earliest item is due, or an earlier one is pushed
+        self._wakeup.clear()
+        delay = self.next_due_in()
+
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def pop_due(self) -> list[RetryItem]:
+        now = time.monotonic()
+        due = []
+
+        while len(self._heap) > 0 and self._heap[0].due <= now:
+            due.append(heapq.heappop(self._heap))
+
+        return due
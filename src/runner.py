@@ -2,36 +2,73 @@ from __future__ import annotations
 
 import argparse
 import asyncio
-import random
+import datetime
+import hashlib
 import concurrent.futures
 import time
 
 import httpx
 import tenacity
 
+from sqlalchemy import select
+
+from typing import Iterator
 from typing import Sequence
 from src import logger
+from src import parse_pool
 from src import parsers
+from src import retry_queue
+from src import throttle
 from src import tracker
 
 from src.db import models
 from src.db import utils
+from src.db import writer
 from src.config import settings
 import time
 import math
 
 TRACKER_CONFIGS = tracker.load_tracker_configs()
 
-
-def async_sleep_random(
-    fixed: int = 4,
-    min: int = 0,
-    max: int = 3
-) -> int:
-    delay = random.randint(a=min, b=max)
-    return fixed + delay
-
-
+# a product is sold out when /products.json listed variants for it and
+# none of them is available, unknown availability counts as in stock.
+# the unary `+` keeps sqlite on the primary key, so each keyset chunk is
+# a range seek instead of a status_code lookup + sort of every product
+_TODOS_STMT = """
+SELECT p.id, p.url, p.handle
+FROM product AS p
+WHERE +p.status_code IN (200, 430)
+    AND p.id > :after_id
+    AND (
+        EXISTS (
+            SELECT 1 FROM variant AS v
+            WHERE v.product_id = p.id
+                AND COALESCE(v.available, 1) = 1
+        )
+        OR NOT EXISTS (
+            SELECT 1 FROM variant AS v
+            WHERE v.product_id = p.id
+        )
+    ) = :in_stock
+ORDER BY p.id
+LIMIT :limit
+"""
+
+_LAST_QUANTITIES_STMT = """
+SELECT i.variant_id, i.inventory_quantity
+FROM inventory AS i
+JOIN (
+    SELECT MAX(id) AS id
+    FROM inventory
+    GROUP BY variant_id
+) AS last
+    ON last.id = i.id
+"""
+
+_HTTP_CACHE_STMT = """
+SELECT url, etag, last_modified, content_hash
+FROM http_cache
+"""
 
 
 def get_hash(e:str):
@@ -49,32 +86,91 @@ def get_hash(e:str):
     return (4294967296 * (2097151 & r)) + (u & 0xFFFFFFFF)    
 
 
+def get_async_client(http2: bool | None = None) -> httpx.AsyncClient:
+    if http2 is None:
+        http2 = settings.HTTP2_ENABLED
+
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.get_logger("tracker").warning(
+                msg="http2 requested but `h2` is not installed, using http/1.1"
+            )
+            http2 = False
+
+    limits = httpx.Limits(
+        max_connections=settings.MAX_CONNECTIONS,
+        max_keepalive_connections=settings.MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.KEEPALIVE_EXPIRY,
+    )
+
+    # waiting for a connection from the shared pool is local contention,
+    # not a slow host, so it has no timeout and never reaches the
+    # per-host controllers as a PoolTimeout
+    timeout = httpx.Timeout(settings.REQUEST_TIMEOUT, pool=None)
+
+    return httpx.AsyncClient(
+        limits=limits,
+        http2=http2,
+        timeout=timeout,
+    )
+
+
+_request_retry = tenacity.retry(
+    stop=tenacity.stop_after_attempt(
+        max_attempt_number=settings.MAX_RETRIES
+    ),
+    wait=(
+        tenacity.wait_fixed(settings.RETRY_SLEEP_DELAY)
+        + tenacity.wait_random_exponential(
+            multiplier=10,
+            max=120
+        )
+    ),
+)
+
+
 class TrackerRunner:
     def __init__(
         self,
-        tracker_config: tracker.TrackerConfig
+        tracker_config: tracker.TrackerConfig,
+        client: httpx.AsyncClient | None = None,
+        parser_pool: parse_pool.ParserPool | None = None
     ) -> None:
-        self.client = httpx.AsyncClient()
+        # a shared client/parser pool is owned (and closed) by the caller
+        self._owns_client = client is None
+        self.client = get_async_client() if client is None else client
+
+        self._owns_parser_pool = parser_pool is None
+        self.parser_pool = (
+            parse_pool.get_parser_pool([tracker_config.parser])
+            if parser_pool is None
+            else parser_pool
+        )
 
         self.config = tracker_config
+        self.controller = throttle.AIMDController(
+            host=httpx.URL(self.config.base_url).host
+        )
+        self.retries = retry_queue.RetryQueue()
+        self.sold_out = 0
+        self.catalog_inventory: bool | None = None
+        self.catalog_missing = 0
+        self.http_cache: dict[str, dict] = {}
+        self.unchanged = 0
+        self.run_id: int | None = None
+        self.last_quantity: dict[int, int] = {}
         self.llogger = logger.get_logger("tracker")
         self.engine = utils.get_engine(self.config.sqlite_uri)
-        
-        utils.LocalSession.configure(bind=self.engine)
-        self.session = utils.LocalSession
-
-    @tenacity.retry(
-        stop=tenacity.stop_after_attempt(
-            max_attempt_number=settings.MAX_RETRIES
-        ),
-        wait=(
-            tenacity.wait_fixed(settings.RETRY_SLEEP_DELAY)
-            + tenacity.wait_random_exponential(
-                multiplier=10,
-                max=120
-            )
-        ),
-    )
+        utils.enable_wal(self.engine)
+
+        # one sessionmaker per runner, so concurrent runners never
+        # write into each other's database
+        self.session = utils.get_sessionmaker(self.engine)
+        self.writer = writer.BatchWriter(session=self.session)
+
+    @_request_retry
     async def async_request(
         self,
         client: httpx.AsyncClient,
@@ -82,11 +178,27 @@ class TrackerRunner:
         url: str,
         **kwargs
     ) -> httpx.Response | None:
+        return await self.request_once(
+            client=client, method=method, url=url, **kwargs
+        )
+
+    async def request_once(
+        self,
+        client: httpx.AsyncClient,
+        method: str,
+        url: str,
+        **kwargs
+    ) -> httpx.Response | None:
 
         try:
-            response = await client.request(
-                method=method, url=url, **kwargs
-            )
+            await self.controller.acquire()
+            try:
+                response = await client.request(
+                    method=method, url=url, **kwargs
+                )
+            finally:
+                await self.controller.release()
+
             response = response.raise_for_status()
 
             if response is None:
@@ -103,6 +215,7 @@ class TrackerRunner:
                     msg=f"http request ({response.status_code}): "
                         f"{method} {url} {params}"
                 )
+                self.controller.on_success()
                 return response
 
         except httpx.HTTPStatusError as e:
@@ -117,14 +230,24 @@ class TrackerRunner:
             elif e.response.status_code == 301:
                 return e.response
 
-            elif e.response.status_code == 430:
-                await asyncio.sleep(120)
+            elif e.response.status_code == 304:
+                # answer to a conditional request, nothing changed
+                self.controller.on_success()
+                return e.response
+
+            elif e.response.status_code in (429, 430):
+                self.controller.on_throttle(
+                    retry_after=throttle.parse_retry_after(
+                        e.response.headers.get("Retry-After")
+                    )
+                )
                 raise tenacity.TryAgain
 
             else:
                 raise tenacity.TryAgain
 
-        except httpx.ReadTimeout as e:
+        except httpx.TimeoutException:
+            self.controller.on_timeout()
             self.llogger.error(msg=f"failed with timeout: {url}")
             raise tenacity.TryAgain
 
@@ -134,158 +257,616 @@ class TrackerRunner:
         except Exception:
             self.llogger.error(msg=f"server not response: {url}")
 
-    async def proces_one(
-        self, product: dict, sem: asyncio.Semaphore
+    @property
+    def batch_size(self) -> int:
+        # parsers whose endpoint answers for several products per request
+        # declare how many, everything else is fetched one by one
+        return getattr(self.config.parser_class, "batch_size", 1)
+
+    def get_product_url(self, products: list[dict]) -> str:
+        url = ""
+        if "JSON" in self.config.parser:
+            url = products[0]["url"] + ".json"
+        elif "HTML" in self.config.parser:
+            if "HTMLEasyStockParser" == self.config.parser:
+                # one signature covers the whole comma separated batch
+                q = ",".join(p["handle"] for p in products)
+                t = str(int(time.time()*1000))
+                s = 'dM1xupB07XNx'
+                hash_prod = get_hash(q+t+s)
+
+                url = self.config.base_url+"/apps/easystock/?q={}&sign={}&timeh={}".format(q,hash_prod,t)
+            else:
+                url = products[0]["url"]
+
+        return url
+
+    def get_cache_key(self, products: list[dict]) -> str:
+        # product urls are stable, signed easystock urls are not
+        return ",".join(p["url"] for p in products)
+
+    def load_http_cache(self) -> dict[str, dict]:
+        rows = utils.execute_select_statement(
+            session=self.session(), statement=_HTTP_CACHE_STMT
+        )
+
+        return {r["url"]: r for r in rows}
+
+    def get_request_headers(self, cache_key: str) -> dict[str, str]:
+        headers = dict(settings.SHARED_HEADERS)
+
+        cached = self.http_cache.get(cache_key)
+        if cached is not None:
+            if cached["etag"] is not None:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"] is not None:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        return headers
+
+    async def proces_batch(
+        self, products: list[dict], attempt: int = 0
     ) -> None:
-        async with sem:
-            url = ""
-            if "JSON" in self.config.parser:
-                url = product["url"] + ".json" 
-            elif "HTML" in self.config.parser:
-                if "HTMLEasyStockParser" == self.config.parser:
-                    q = product["handle"]
-                    t=str(int(time.time()*1000))
-                    s='dM1xupB07XNx'
-                    hash_prod = get_hash(q+t+s)
-                    
-                    url = self.config.base_url+"/apps/easystock/?q={}&sign={}&timeh={}".format(q,hash_prod,t)
-                else:
-                    url = product["url"]
-            
-
-            if sem.locked():
-                delay = async_sleep_random(
-                    fixed=40,
-                    min=1,
-                    max=10
-                )
-                await asyncio.sleep(delay)
+        url = self.get_product_url(products)
+        cache_key = self.get_cache_key(products)
 
-            await asyncio.sleep(0.5)
-            response = await self.async_request(
+        try:
+            response = await self.request_once(
                 client=self.client,
                 method="GET",
                 url=url,
-                headers=settings.SHARED_HEADERS
+                headers=self.get_request_headers(cache_key)
             )
 
-            if response is not None:
+        except tenacity.TryAgain:
+            # give the slot back and try again later from the queue
+            if not self.retries.push(item=products, attempt=attempt+1):
+                self.llogger.warning(
+                    msg=f"giving up on {url} after {attempt+1} attempt(s)"
+                )
+            return
+
+        if response is not None:
+            if response.status_code == 304:
+                self.unchanged += len(products)
+
+            elif (
+                response.status_code != 200
+                and response.status_code != 430
+            ):
+                if len(products) > 1:
+                    # one bad handle must not mark the whole batch, find
+                    # it with one request per product
+                    for product in products:
+                        await self.proces_batch([product], attempt=attempt)
+                    return
+
+                await self.store_status(products[0], response.status_code)
+
+            elif response.status_code == 200:
+                content_hash = hashlib.blake2b(
+                    response.content, digest_size=16
+                ).hexdigest()
+
+                cached = self.http_cache.get(cache_key)
                 if (
-                    response.status_code != 200
-                    and response.status_code != 430
+                    cached is not None
+                    and cached["content_hash"] == content_hash
                 ):
-                    value = {
-                        "id": product["id"],
-                        "status_code": response.status_code
-                    }
-                    utils.update_one(
-                        session=self.session(),
-                        value=value,
-                        instance=models.ShopifyProduct
-                    )
+                    self.unchanged += len(products)
+                    return
 
-                elif response.status_code == 200:
-                    custom_parser = self.config.parser_class()
-                    values = custom_parser.parse(markup=response.text)
+                missing = self.get_missing_products(products, response)
+                if len(missing) == len(products) == 1:
+                    # answered, but not for this product
+                    await self.store_status(products[0], 404)
+                    return
 
-                    utils.upsert_many(
-                        session=self.session(),
-                        values=values,
-                        instance=models.ShopifyInventory
+                values = await self.parse(response)
+
+                await self.store_inventory(values)
+
+                # a batch is not trusted for handles it left out, they
+                # are fetched one by one like a failed batch
+                if len(missing) > 0:
+                    self.llogger.warning(
+                        msg=f"{len(missing)} of {len(products)} product(s) "
+                            f"missing from {url}, fetching them one by one"
+                    )
+                for product in missing:
+                    await self.proces_batch([product], attempt=attempt)
+
+                if settings.CONDITIONAL_REQUESTS and len(missing) == 0:
+                    await self.writer.put(
+                        instance=models.ShopifyHttpCache,
+                        rows=[
+                            {
+                                "url": cache_key,
+                                "etag": response.headers.get("etag"),
+                                "last_modified": response.headers.get(
+                                    "last-modified"
+                                ),
+                                "content_hash": content_hash,
+                            }
+                        ]
                     )
 
+    def get_missing_products(
+        self, products: list[dict], response: httpx.Response
+    ) -> list[dict]:
+        # parsers answering for several products at once tell which
+        # handles a response covers
+        get_handles = getattr(self.config.parser_class, "get_handles", None)
+        if get_handles is None:
+            return []
+
+        answered = get_handles(response.content)
+        return [p for p in products if p["handle"] not in answered]
+
+    async def store_status(self, product: dict, status_code: int) -> None:
+        await self.writer.put(
+            instance=models.ShopifyProduct,
+            rows=[{"id": product["id"], "status_code": status_code}],
+            kind=writer.UPDATE
+        )
+
+    def start_run(self) -> int:
+        with self.session() as session:
+            run = models.ShopifyRun(storage=self.config.storage)
+            session.add(run)
+            session.commit()
+
+            return run.id
+
+    def load_last_quantities(self) -> dict[int, int]:
+        rows = utils.execute_select_statement(
+            session=self.session(), statement=_LAST_QUANTITIES_STMT
+        )
+
+        return {r["variant_id"]: r["inventory_quantity"] for r in rows}
+
+    async def store_inventory(self, rows: list[dict]) -> None:
+        if self.config.storage == "changes":
+            # only quantities that differ from the last recorded one are
+            # stored, see `inventory.quantity_as_of` for snapshots
+            changed = []
+            for r in rows:
+                variant_id = r["variant_id"]
+                if (
+                    variant_id in self.last_quantity
+                    and self.last_quantity[variant_id]
+                    == r["inventory_quantity"]
+                ):
+                    continue
+
+                self.last_quantity[variant_id] = r["inventory_quantity"]
+                changed.append(r)
+
+            rows = changed
+
+        for r in rows:
+            r["run_id"] = self.run_id
+
+        await self.writer.put(
+            instance=models.ShopifyInventory,
+            rows=rows
+        )
+
+    async def parse(self, response: httpx.Response) -> list[dict]:
+        if (
+            self.parser_pool is None
+            or not parse_pool.uses_parser_pool(self.config.parser)
+        ):
+            custom_parser = self.config.parser_class()
+            return custom_parser.parse(markup=response.text)
+
+        return await self.parser_pool.parse(
+            parser_name=self.config.parser,
+            content=response.content,
+            encoding=response.encoding or "utf-8"
+        )
+
     def _has_no_products(self, data: dict) -> bool:
         if len(data["products"]) == 0:
             return True
         else:
             return False
 
-    async def process_many(self) -> None:
-        page_number = 1
+    @_request_retry
+    async def stream_catalog_page(self, params: dict) -> dict | None:
+        # decodes the page while it downloads, keeping only the columns
+        # `ShopifyProductsParser` stores instead of the full response body
+        url = self.config.products_json_url
 
-        while True:
-            params = {
-                "json": "true",
-                "limit": 250,
-                "page": page_number
-            }
+        await self.controller.acquire()
+        try:
+            async with self.client.stream(
+                method="GET", url=url, params=params
+            ) as response:
+                if response.status_code in (429, 430):
+                    self.controller.on_throttle(
+                        retry_after=throttle.parse_retry_after(
+                            response.headers.get("Retry-After")
+                        )
+                    )
+                    raise tenacity.TryAgain
+
+                if response.status_code >= 500:
+                    raise tenacity.TryAgain
+
+                self.llogger.info(
+                    msg=f"http request ({response.status_code}): "
+                        f"GET {url} {params}"
+                )
+                if response.status_code != 200:
+                    return None
+
+                decoder = parsers.ProductsStreamDecoder()
+                products = []
+                async for chunk in response.aiter_bytes():
+                    products.extend(decoder.feed(chunk))
+                products.extend(decoder.close())
+
+        except httpx.TimeoutException:
+            self.controller.on_timeout()
+            self.llogger.error(msg=f"failed with timeout: {url}")
+            raise tenacity.TryAgain
+
+        except httpx.RemoteProtocolError:
+            self.llogger.error(msg=f"server not response: {url}")
+            raise tenacity.TryAgain
+
+        finally:
+            await self.controller.release()
+
+        self.controller.on_success()
+        return {"products": products}
+
+    async def fetch_catalog_page(self, params: dict) -> dict | None:
+        if settings.STREAM_CATALOG_PAGES:
+            return await self.stream_catalog_page(params)
+
+        response = await self.async_request(
+            client=self.client,
+            method="GET",
+            url=self.config.products_json_url,
+            params=params
+        )
+
+        if response is None or response.status_code != 200:
+            return None
+
+        return response.json()
+
+    async def store_catalog_page(self, data: dict) -> None:
+        pparser = parsers.ShopifyProductsParser(response=data)
+        pparser.parse_products(base_url=self.config.base_url)
 
-            delay = async_sleep_random(
-                fixed=settings.ASYNC_SLEEP_DELAY
+        await self.writer.put(
+            instance=models.ShopifyProduct,
+            rows=pparser.products
+        )
+        await self.writer.put(
+            instance=models.ShopifyVariant,
+            rows=pparser.variants
+        )
+
+        if self.config.mode == "product":
+            return
+
+        # "auto" decides on the first page: the catalog only replaces the
+        # per-product phase when it carries a quantity for every variant
+        if self.catalog_inventory is None:
+            self.catalog_inventory = (
+                self.config.mode == "catalog"
+                or len(pparser.inventory) == len(pparser.variants) > 0
             )
-            await asyncio.sleep(delay)
 
-            response = await self.async_request(
-                client=self.client,
-                method="GET",
-                url=self.config.products_json_url,
-                params=params
+        if self.catalog_inventory:
+            self.catalog_missing += (
+                len(pparser.variants) - len(pparser.inventory)
             )
+            await self.store_inventory(pparser.inventory)
+
+    async def paginate_by_page(self) -> None:
+        # keeps up to the host's current concurrency limit of pages in
+        # flight and consumes them in order, so storing page N overlaps
+        # with fetching the pages after it
+        tasks: dict[int, asyncio.Task] = {}
+        next_page = 1
+        page_number = 1
 
-            if response is None:
-                break
+        try:
+            while True:
+                window = min(
+                    self.controller.limit,
+                    settings.MAX_CONCURRENT_CATALOG_PAGES
+                )
+                while len(tasks) < max(window, 1):
+                    params = {
+                        "json": "true",
+                        "limit": settings.CATALOG_PAGE_SIZE,
+                        "page": next_page
+                    }
+                    tasks[next_page] = asyncio.create_task(
+                        self.fetch_catalog_page(params)
+                    )
+                    next_page += 1
 
-            if self._has_no_products(response.json()):
-                break
+                data = await tasks.pop(page_number)
 
-            pparser = parsers.ShopifyProductsParser(
-                response=response.json()
-            )
-            pparser.parse_products(base_url=self.config.base_url)
+                if data is None or self._has_no_products(data):
+                    break
 
-            utils.upsert_many(
-                session=self.session(),
-                values=pparser.products,
-                instance=models.ShopifyProduct
+                await self.store_catalog_page(data)
+                page_number += 1
+
+        except tenacity.RetryError:
+            self.llogger.error(
+                msg=f"catalog page {page_number} failed, "
+                    f"stopping pagination for {self.config.name}"
             )
 
-            utils.upsert_many(
-                session=self.session(),
-                values=pparser.variants,
-                instance=models.ShopifyVariant
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    async def paginate_by_since_id(self) -> None:
+        # a `since_id` cursor is inherently sequential, but the next page
+        # is requested as soon as the cursor is known, before storing
+        params = {"limit": settings.CATALOG_PAGE_SIZE, "since_id": 0}
+        pending: asyncio.Task | None = asyncio.create_task(
+            self.fetch_catalog_page(dict(params))
+        )
+
+        try:
+            while pending is not None:
+                data = await pending
+                pending = None
+
+                if data is None or self._has_no_products(data):
+                    break
+
+                params["since_id"] = max(p["id"] for p in data["products"])
+                pending = asyncio.create_task(
+                    self.fetch_catalog_page(dict(params))
+                )
+
+                await self.store_catalog_page(data)
+
+        except tenacity.RetryError:
+            self.llogger.error(
+                msg=f"catalog page since_id={params['since_id']} failed, "
+                    f"stopping pagination for {self.config.name}"
             )
 
-            page_number += 1
+        finally:
+            if pending is not None:
+                pending.cancel()
+                await asyncio.gather(pending, return_exceptions=True)
 
-    def get_todos(self) -> list[dict]:
-        stmt = """
-            SELECT id, url, handle
-            FROM product
-            WHERE status_code IN (200, 430);
-        """
+    async def process_many(self) -> None:
+        if self.config.pagination == "since_id":
+            await self.paginate_by_since_id()
+        else:
+            await self.paginate_by_page()
+
+    def get_todos(
+        self,
+        after_id: int = 0,
+        limit: int = settings.TODO_CHUNK_SIZE,
+        in_stock: bool = True
+    ) -> list[dict]:
         todos = utils.execute_select_statement(
             session=self.session(),
-            statement=stmt
+            statement=_TODOS_STMT,
+            params={
+                "after_id": after_id,
+                "limit": limit,
+                "in_stock": int(in_stock),
+            }
         )
 
         return todos
 
-    async def __call__(self) -> None:
-        utils.init_database(
-            engine=self.engine, metadata=models.ShopifyBase.metadata
+    def iter_todos(self) -> Iterator[tuple[list[dict], bool]]:
+        # keyset pagination keeps only one chunk of products in memory and
+        # never holds a read cursor open while results are being written
+        # sold-out products come in a second pass, as (chunk, in_stock)
+        for in_stock in (True, False):
+            after_id = 0
+
+            while True:
+                todos = self.get_todos(after_id=after_id, in_stock=in_stock)
+                if len(todos) == 0:
+                    break
+
+                after_id = todos[-1]["id"]
+                yield todos, in_stock
+
+    async def store_sold_out(self, products: list[dict]) -> None:
+        # the catalog already says every variant of these is unavailable,
+        # record them as 0 without fetching their pages
+        with self.session() as session:
+            variant_ids = session.scalars(
+                select(models.ShopifyVariant.id).where(
+                    models.ShopifyVariant.product_id.in_(
+                        [p["id"] for p in products]
+                    )
+                )
+            ).all()
+
+        await self.store_inventory(
+            [
+                {"variant_id": variant_id, "inventory_quantity": 0}
+                for variant_id in variant_ids
+            ]
         )
 
-        await self.process_many()
+    async def produce_todos(self, queue: asyncio.Queue) -> None:
+        batch: list[dict] = []
+
+        for todos, in_stock in self.iter_todos():
+            if not in_stock:
+                self.sold_out += len(todos)
+                if settings.SOLD_OUT_POLICY == "skip":
+                    await self.store_sold_out(todos)
+                    continue
+
+            for product in todos:
+                batch.append(product)
+                if len(batch) >= self.batch_size:
+                    await queue.put((batch, 0))
+                    batch = []
+
+        if len(batch) > 0:
+            await queue.put((batch, 0))
+
+    async def dispatch_retries(self, queue: asyncio.Queue) -> None:
+        while True:
+            await self.retries.wait_due()
+
+            for retry in self.retries.pop_due():
+                await queue.put((retry.item, retry.attempt))
+                self._dispatched.set()
 
-        sem = asyncio.Semaphore(value=settings.MAX_ASYNC_WORKER)
+    async def fetch_worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            products, attempt = await queue.get()
+            try:
+                await self.proces_batch(products=products, attempt=attempt)
+
+            except Exception:
+                self.llogger.exception(
+                    msg=f"failed processing product(s) "
+                        f"{[p['id'] for p in products]}"
+                )
+
+            finally:
+                queue.task_done()
+
+    async def process_products(self) -> None:
+        if settings.CONDITIONAL_REQUESTS:
+            self.http_cache = self.load_http_cache()
+
+        queue: asyncio.Queue = asyncio.Queue(
+            maxsize=settings.TODO_QUEUE_SIZE
+        )
+        self._dispatched = asyncio.Event()
         tasks = [
-            asyncio.create_task(
-                self.proces_one(product=product, sem=sem)
-            )
-            for product in self.get_todos()
+            asyncio.create_task(self.fetch_worker(queue))
+            for _ in range(settings.MAX_ASYNC_WORKER)
         ]
+        tasks.append(asyncio.create_task(self.dispatch_retries(queue)))
 
         try:
-            await asyncio.gather(*tasks)
+            await self.produce_todos(queue)
 
-        except tenacity.RetryError:
-            pass
+            # the run ends once every fetch is done and the retry queue
+            # has drained (or ran out of budget), pending retries are
+            # waited for through the dispatcher
+            while True:
+                await queue.join()
+                if len(self.retries) == 0:
+                    break
+
+                self._dispatched.clear()
+                await self._dispatched.wait()
 
         finally:
             for task in tasks:
                 task.cancel()
 
-            await self.client.aclose()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def __call__(self) -> None:
+        utils.init_database(
+            engine=self.engine, metadata=models.ShopifyBase.metadata
+        )
+
+        self.run_id = self.start_run()
+        if self.config.storage == "changes":
+            self.last_quantity = self.load_last_quantities()
+
+        self.writer.start()
+        try:
+            await self.process_many()
+
+            if self.catalog_inventory:
+                self.llogger.info(
+                    msg=f"inventory for {self.config.name} taken from "
+                        f"/products.json, {self.catalog_missing} variant(s) "
+                        f"without a quantity"
+                )
+            else:
+                # todos are read back from the database, so the catalog
+                # must land first
+                await self.writer.flush()
+                await self.process_products()
+
+            # runs that crash keep finished_at empty
+            await self.writer.put(
+                instance=models.ShopifyRun,
+                rows=[
+                    {
+                        "id": self.run_id,
+                        "finished_at": datetime.datetime.now(
+                            datetime.timezone.utc
+                        ),
+                    }
+                ],
+                kind=writer.UPDATE
+            )
+
+        finally:
+            await self.writer.close()
+
+            self.llogger.info(
+                msg=f"db writer for {self.config.name}: "
+                    f"{self.writer.stats.rows} row(s) in "
+                    f"{self.writer.stats.flushes} flush(es), "
+                    f"{self.writer.stats.rows_per_second:.0f} rows/s",
+                extra=self.writer.stats.snapshot()
+            )
+
+            if self.sold_out > 0:
+                verb = "deferred"
+                if settings.SOLD_OUT_POLICY == "skip":
+                    verb = "recorded without fetching"
+
+                self.llogger.info(
+                    msg=f"{verb} {self.sold_out} sold-out product(s) "
+                        f"for {self.config.name}"
+                )
+
+            if self.unchanged > 0:
+                self.llogger.info(
+                    msg=f"{self.unchanged} product(s) unchanged since the "
+                        f"last run for {self.config.name}"
+                )
+
+            if self.retries.scheduled > 0:
+                self.llogger.info(
+                    msg=f"retries for {self.config.name}: "
+                        f"scheduled={self.retries.scheduled} "
+                        f"dropped={self.retries.dropped} "
+                        f"pending={len(self.retries)}"
+                )
+
+            self.llogger.info(
+                msg=f"host concurrency for {self.config.name}: "
+                    f"limit={self.controller.limit} "
+                    f"rate={self.controller.request_rate:.2f} req/s",
+                extra=self.controller.snapshot()
+            )
+
+            if self._owns_client:
+                await self.client.aclose()
+
+            if self._owns_parser_pool and self.parser_pool is not None:
+                self.parser_pool.close()
 
 
 def run_in_subprocess(
@@ -327,6 +908,42 @@ async def run_all_trackers(
         await asyncio.sleep(10)
 
 
+async def run_all_trackers_parallel(
+    configs: list[tracker.TrackerConfig]
+) -> None:
+    llogger = logger.get_logger("tracker")
+
+    pool = parse_pool.get_parser_pool(
+        [config.parser for config in configs]
+    )
+
+    try:
+        async with get_async_client() as client:
+            runners = [
+                TrackerRunner(
+                    tracker_config=config,
+                    client=client,
+                    parser_pool=pool
+                )
+                for config in configs
+            ]
+            results = await asyncio.gather(
+                *[runner() for runner in runners],
+                return_exceptions=True
+            )
+
+    finally:
+        if pool is not None:
+            pool.close()
+
+    for config, result in zip(configs, results):
+        if isinstance(result, BaseException):
+            llogger.error(
+                msg=f"tracker {config.name} failed: {result!r}",
+                extra={"tracker": config.name}
+            )
+
+
 async def run_tracker_by_id(id: int) -> None:
     config = TRACKER_CONFIGS[id]
     runner = TrackerRunner(
@@ -347,6 +964,11 @@ def main(argv: Sequence[str] | None = None) -> int:
         action="store_true",
         help="run all trackers in configured order"
     )
+    aparser.add_argument(
+        "--parallel",
+        action="store_true",
+        help="with --run-all/--run-from, run trackers concurrently on one shared http client"
+    )
     aparser.add_argument(
         "--run-from",
         action="store",
@@ -375,14 +997,20 @@ def main(argv: Sequence[str] | None = None) -> int:
         print(f"updated {settings.SQLITE_DB_ROOT} -> {args.test}")
         settings.SQLITE_DB_ROOT = args.test
 
+    run_many = (
+        run_all_trackers_parallel
+        if args.parallel
+        else run_all_trackers
+    )
+
     if args.run_all:
         logger.init_logger()
-        asyncio.run(run_all_trackers(TRACKER_CONFIGS))
+        asyncio.run(run_many(TRACKER_CONFIGS))
 
     if args.run_from:
         logger.init_logger()
         configs = TRACKER_CONFIGS[args.run_from:]
-        asyncio.run(run_all_trackers(configs))
+        asyncio.run(run_many(configs))
 
     if args.run:
         start = time.monotonic()
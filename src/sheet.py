@@ -17,6 +17,7 @@ from gspread.utils import rowcol_to_a1
 
 from src import logger
 from src import inventory
+from src import inventory_cache
 from src import tracker
 from src.config import settings
 from src.db import utils
@@ -152,7 +153,7 @@ class SheetWriter:
         self.sheet.update(
             values=(
                 [self.data.columns.tolist()]
-                + self.data.values.tolist()
+                + inventory.to_rows(self.data)
             ),
             raw=True,
             range_name=self.config.dimension.range
@@ -332,7 +333,7 @@ def run_all_sheets(configs: list[SpreadSheetConfig]) -> None:
                     url=sheet_config.sqlite_uri
                 )
 
-                data = inventory.compute_inventory(engine)
+                data = inventory_cache.get_inventory(engine)
 
                 writer = SheetWriter(
                     data=data,
@@ -363,7 +364,7 @@ def run_sheets(config: SpreadSheetConfig) -> None:
                 url=sheet_config.sqlite_uri
             )
 
-            data = inventory.compute_inventory(engine)
+            data = inventory_cache.get_inventory(engine)
 
             writer = SheetWriter(
                 data=data,
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import asyncio
+import datetime
+import email.utils
+import time
+
+from src.config import settings
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    if value is None:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    return max((retry_at - now).total_seconds(), 0.0)
+
+
+class AIMDController:
+    # additive-increase / multiplicative-decrease limit on the number of
+    # in-flight requests to one host, in the spirit of tcp congestion control
+    def __init__(
+        self,
+        host: str,
+        initial: int = settings.AIMD_INITIAL_LIMIT,
+        minimum: int = settings.AIMD_MIN_LIMIT,
+        maximum: int = settings.MAX_CONNECTIONS_PER_HOST,
+        decrease_factor: float = settings.AIMD_DECREASE_FACTOR,
+        cooldown: float = settings.THROTTLE_COOLDOWN,
+        max_cooldown: float = settings.MAX_THROTTLE_COOLDOWN,
+    ) -> None:
+        self.host = host
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self._limit = float(min(max(initial, minimum), maximum))
+        self._in_flight = 0
+        self._cooldown = cooldown
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+        self.started_at = time.monotonic()
+        self.successes = 0
+        self.throttled = 0
+        self.timeouts = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def request_rate(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        if elapsed <= 0:
+            return 0.0
+        return self.successes / elapsed
+
+    async def acquire(self) -> None:
+        # the throttle block is slept out before a slot is taken, a task
+        # cancelled while waiting holds nothing that needs releasing
+        while True:
+            delay = self._blocked_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            async with self._condition:
+                await self._condition.wait_for(
+                    lambda: self._in_flight < self.limit
+                )
+
+                # a throttle seen while waiting for the slot blocks again
+                if self._blocked_until <= time.monotonic():
+                    self._in_flight += 1
+                    return
+
+    async def release(self) -> None:
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self) -> None:
+        self.successes += 1
+        self._cooldown = self.base_cooldown
+
+        # grows by roughly one slot per window of clean responses
+        self._limit = min(self._limit + 1 / self._limit, self.maximum)
+
+    def on_throttle(self, retry_after: float | None = None) -> None:
+        self.throttled += 1
+        self._decrease()
+        self._block(retry_after)
+
+    def on_timeout(self) -> None:
+        self.timeouts += 1
+        self._decrease()
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+
+        # a burst of failures from the same congestion event only cuts once
+        if now - self._last_decrease < self._cooldown:
+            return
+
+        self._last_decrease = now
+        self._limit = max(self._limit * self.decrease_factor, self.minimum)
+
+    def _block(self, retry_after: float | None) -> None:
+        if retry_after is None:
+            delay = self._cooldown
+            self._cooldown = min(self._cooldown * 2, self.max_cooldown)
+        else:
+            delay = min(retry_after, self.max_cooldown)
+
+        self._blocked_until = max(
+            self._blocked_until, time.monotonic() + delay
+        )
+
+    def snapshot(self) -> dict:
+        return {
+            "host": self.host,
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "successes": self.successes,
+            "throttled": self.throttled,
+            "timeouts": self.timeouts,
+            "request_rate": round(self.request_rate, 3),
+        }
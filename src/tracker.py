@@ -52,6 +52,10 @@ class TrackerConfig(NamedTuple):
     url: str
     parser: str = "JSONParser"
     sqlite_root: str = settings.SQLITE_DB_ROOT
+    pagination: str = "page"
+    mode: str = "auto"
+    storage: str = "full"
+    retention: dict | bool | None = None
 
     @property
     def base_url(self) -> str:
@@ -76,6 +80,11 @@ class TrackerConfig(NamedTuple):
     def db_name(self) -> str:
         return self.url.replace("https://","").replace("www.","")
 
+    @property
+    def db_path(self) -> pathlib.Path:
+        # the file `sqlite_uri` points the runner at
+        return pathlib.Path(self.sqlite_root) / f"{self.db_name}.db"
+
     @property
     def sqlite_uri(self) -> str:
         db_path="data/sqlite/"+self.name+".db"
@@ -98,14 +107,7 @@ class TrackerConfig(NamedTuple):
     def parser_class(
         self
     ) -> type[parsers.HTMLParser | parsers.JSONParser]:
-        subclasses = parsers.HTMLParser.__subclasses__()
-        for s in subclasses:
-            if s.__name__ == self.parser:
-                return s
-            else:
-                continue
-
-        return parsers.JSONParser
+        return parsers.get_parser_class(self.parser)
 
 
 def load_tracker_configs() -> list[TrackerConfig]:
@@ -119,7 +121,11 @@ def load_tracker_configs() -> list[TrackerConfig]:
         return [
             TrackerConfig(
                 url=tracker["url"],
-                parser=tracker["parser"]
+                parser=tracker["parser"],
+                pagination=tracker.get("pagination", "page"),
+                mode=tracker.get("mode", "auto"),
+                storage=tracker.get("storage", "full"),
+                retention=tracker.get("retention")
             )
             for tracker in base_config["trackers"]
         ]